@@ -0,0 +1,60 @@
+'''
+Business: Once-per-container initialization - settings, the connection pool and replica routing
+Args: none; values come from environment variables read on first use
+Returns: settings dict, the process-wide pool and read router, all reused across warm invocations
+'''
+
+import os
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+_pool: Optional[Any] = None
+_read_router: Optional[Any] = None
+
+
+@lru_cache(maxsize=1)
+def settings() -> Dict[str, Any]:
+    return {
+        'dsn': os.environ.get('DATABASE_URL'),
+        'jwt_secret': os.environ.get('JWT_SECRET'),
+        'pool_min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '1')),
+        'pool_max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '4')),
+        'pool_max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME', '1800')),
+        'pool_max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', '300')),
+        # whitespace-separated, since a libpq URL may itself list hosts with commas
+        'read_dsns': os.environ.get('DATABASE_READ_URL', '').split(),
+        'replica_wait': float(os.environ.get('REPLICA_WAIT_MS', '200')) / 1000,
+        'replica_retry': float(os.environ.get('REPLICA_RETRY_SECONDS', '30')),
+        'replica_checkout_timeout': float(os.environ.get('REPLICA_CHECKOUT_TIMEOUT', '1')),
+        # signs consistency tokens; must match across functions, since clients send one token to all of them
+        'consistency_secret': os.environ.get('CONSISTENCY_SECRET') or os.environ.get('JWT_SECRET')
+    }
+
+
+def get_pool() -> Any:
+    '''
+    Process-wide connection pool, created on first use. psycopg and psycopg_pool are
+    imported here rather than at module load so OPTIONS and cached responses skip them.
+    '''
+    global _pool
+    if _pool is None:
+        from db import create_pool
+        _pool = create_pool(settings())
+    return _pool
+
+
+def get_read_router() -> Any:
+    '''
+    Router for read-only handler branches, created on first use. Without DATABASE_READ_URL
+    every read goes to the primary pool.
+    '''
+    global _read_router
+    if _read_router is None:
+        from db import create_read_router
+        _read_router = create_read_router(get_pool(), settings())
+    return _read_router
+
+
+def read_stats() -> Dict[str, Any]:
+    '''Router counters for the request log; empty until a read or write has used the router'''
+    return _read_router.stats() if _read_router is not None else {}
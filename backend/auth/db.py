@@ -0,0 +1,334 @@
+'''
+Business: Connection pools whose connections report checkout time and SQL statements to the request trace
+Args: settings - dict from bootstrap.settings() with dsn, replica dsns and pool limits
+Returns: opened TracedPool and the ReadRouter over replicas; imported only on code paths that need the database
+'''
+
+import hashlib
+import hmac
+import os
+import random
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from weakref import WeakKeyDictionary
+
+import psycopg
+from psycopg import pq
+from psycopg_pool import ConnectionPool
+
+from instrumentation import current_trace, fingerprint
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+EXPLAIN_SAMPLE_RATE = float(os.environ.get('EXPLAIN_SAMPLE_RATE', '0.1'))
+HEALTH_CHECK_IDLE = float(os.environ.get('DB_HEALTH_CHECK_IDLE', '30'))
+REPLICA_POLL_SECONDS = 0.01
+# statements EXPLAIN accepts; REFRESH MATERIALIZED VIEW, COPY and DDL are never sampled
+EXPLAINABLE = re.compile(r'\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b', re.IGNORECASE)
+
+CONSISTENCY_HEADER = 'X-Consistency-Token'
+WAL_POSITION = 'SELECT pg_current_wal_insert_lsn()::text'
+REPLAY_POSITION = 'SELECT pg_last_wal_replay_lsn()::text'
+
+_last_returned: 'WeakKeyDictionary[psycopg.Connection, float]' = WeakKeyDictionary()
+_health_check: ContextVar[bool] = ContextVar('health_check', default=False)
+
+
+class TracedCursor(psycopg.Cursor):
+    def execute(self, query: Any, params: Any = None, **kwargs: Any) -> 'TracedCursor':
+        trace = current_trace()
+        # the pool's health check (SELECT 1) runs inside checkout, which db_connect already times
+        if trace is None or _health_check.get():
+            return super().execute(query, params, **kwargs)
+        # pipelined statements complete at the sync; execute_write times the whole batch
+        if self.connection.pgconn.pipeline_status:
+            super().execute(query, params, **kwargs)
+            trace.queries.append({'query': fingerprint(query), 'pipelined': True})
+            return self
+        started = time.perf_counter()
+        super().execute(query, params, **kwargs)
+        elapsed = time.perf_counter() - started
+        trace.add_phase('db', elapsed)
+        entry = {'query': fingerprint(query), 'ms': round(elapsed * 1000, 2), 'rows': self.rowcount}
+        if elapsed * 1000 >= SLOW_QUERY_MS and random.random() < EXPLAIN_SAMPLE_RATE and explainable(query):
+            entry['plan'] = explain(self.connection, query, params)
+        trace.queries.append(entry)
+        return self
+
+
+def explainable(query: Any) -> bool:
+    text = query.decode() if isinstance(query, bytes) else query if isinstance(query, str) else str(query)
+    return EXPLAINABLE.match(text) is not None
+
+
+def explain(conn: psycopg.Connection, query: Any, params: Any) -> Any:
+    '''
+    Runs under a savepoint, so a failing EXPLAIN leaves the caller's transaction usable
+    instead of aborting it for the statements that follow.
+    '''
+    try:
+        with conn.transaction():
+            with psycopg.Cursor(conn) as cur:
+                cur.execute(f'EXPLAIN (FORMAT JSON) {query}', params)
+                return cur.fetchone()[0]
+    except psycopg.Error as error:
+        return f'explain failed: {error}'
+
+
+def configure_connection(conn: psycopg.Connection) -> None:
+    conn.cursor_factory = TracedCursor
+
+
+def check_idle_connection(conn: psycopg.Connection) -> None:
+    '''
+    Pings only connections that sat in the pool for HEALTH_CHECK_IDLE seconds or more, so a
+    busy container does not pay an extra round trip per checkout. The ping counts towards
+    db_connect and is neither traced as a query nor sampled for EXPLAIN.
+    '''
+    returned = _last_returned.get(conn)
+    if returned is None or time.monotonic() - returned >= HEALTH_CHECK_IDLE:
+        token = _health_check.set(True)
+        try:
+            ConnectionPool.check_connection(conn)
+        finally:
+            _health_check.reset(token)
+
+
+class TracedPool(ConnectionPool):
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[psycopg.Connection]:
+        started = time.perf_counter()
+        with super().connection(timeout) as conn:
+            trace = current_trace()
+            if trace is not None:
+                trace.add_phase('db_connect', time.perf_counter() - started)
+            try:
+                yield conn
+            finally:
+                _last_returned[conn] = time.monotonic()
+
+
+def pipelined_write(conn: psycopg.Connection, query: str, params: Any, row_factory: Any = None,
+                    after_commit: Optional[str] = None) -> Tuple[List[Any], Optional[Any]]:
+    '''
+    Queues BEGIN, the prepared statement and COMMIT in one pipeline, so the write costs the
+    single Sync sent when the pipeline closes. An after_commit query rides in the same
+    pipeline; its single value is returned next to the statement's rows.
+    '''
+    trace = current_trace()
+    cursor = conn.cursor(row_factory=row_factory) if row_factory else conn.cursor()
+    with cursor as cur, psycopg.Cursor(conn) as control, psycopg.Cursor(conn) as followup:
+        started = time.perf_counter()
+        autocommit = conn.autocommit
+        # psycopg syncs its implicit BEGIN on its own, so an idle connection queues an explicit one
+        explicit = conn.info.transaction_status == pq.TransactionStatus.IDLE
+        if explicit:
+            conn.autocommit = True
+        try:
+            with conn.pipeline():
+                if explicit:
+                    control.execute('BEGIN')
+                cur.execute(query, params, prepare=True)
+                # conn.commit() would sync on its own and the pipeline exit would sync again
+                control.execute('COMMIT')
+                if after_commit:
+                    followup.execute(after_commit)
+        finally:
+            if explicit:
+                if conn.info.transaction_status == pq.TransactionStatus.INERROR:
+                    conn.rollback()
+                if conn.info.transaction_status == pq.TransactionStatus.IDLE:
+                    conn.autocommit = autocommit
+        elapsed = time.perf_counter() - started
+        if trace is not None:
+            trace.add_phase('db', elapsed)
+            entry = trace.queries[-1]
+            entry.update(ms=round(elapsed * 1000, 2), rows=cur.rowcount)
+            # EXPLAIN without ANALYZE does not execute the write, so sampling stays side-effect free
+            if elapsed * 1000 >= SLOW_QUERY_MS and random.random() < EXPLAIN_SAMPLE_RATE and explainable(query):
+                entry['plan'] = explain(conn, query, params)
+        rows = cur.fetchall() if cur.description else []
+        return rows, followup.fetchone()[0] if after_commit else None
+
+
+def execute_write(conn: psycopg.Connection, query: str, params: Any, row_factory: Any = None) -> List[Any]:
+    '''One-round-trip write; returns the statement's rows'''
+    return pipelined_write(conn, query, params, row_factory)[0]
+
+
+def parse_lsn(position: Any) -> Optional[int]:
+    '''pg_lsn text such as "16/B374D848" as an integer; None for anything else'''
+    try:
+        high, low = position.split('/')
+        high, low = int(high, 16), int(low, 16)
+    except (AttributeError, ValueError):
+        return None
+    if not 0 <= high <= 0xFFFFFFFF or not 0 <= low <= 0xFFFFFFFF:
+        return None
+    return high << 32 | low
+
+
+def consistency_headers(token: Optional[str]) -> Dict[str, str]:
+    if not token:
+        return {}
+    return {CONSISTENCY_HEADER: token, 'Access-Control-Expose-Headers': CONSISTENCY_HEADER}
+
+
+class ReadRouter:
+    '''
+    Read-only branches take connections here, writes keep using the primary pool.
+    Replicas are tried round-robin; one that fails a checkout or a query is skipped
+    for retry_after seconds, and with no usable replica reads go to the primary.
+
+    A read must see every write made through this container and, when the client
+    sends the token a write returned, that write too. A replica serves it only once
+    its replay LSN has reached the newer of the two, polled for up to wait seconds;
+    the last replay LSN seen per replica is kept, so once a replica has caught up
+    reads pay no extra round trip.
+
+    Tokens are "<lsn>.<hmac>" signed with secret: a forged far-future LSN would
+    otherwise send every read it accompanies to the primary after a full wait.
+    They are issued even without replicas, because handlers also bypass their
+    per-instance caches for a verified token. Without a secret no tokens are
+    issued and client tokens are ignored.
+    '''
+
+    def __init__(self, primary: 'TracedPool', replicas: List['TracedPool'], wait: float, retry_after: float,
+                 checkout_timeout: float, secret: Optional[str] = None):
+        self.primary = primary
+        self.replicas = replicas
+        self.wait = wait
+        self.retry_after = retry_after
+        self.checkout_timeout = checkout_timeout
+        self._key = secret.encode() if secret else None
+        self.written = 0
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.lag_fallbacks = 0
+        self.failovers = 0
+        self._next = 0
+        self._down_until = [0.0] * len(replicas)
+        self._replayed = [0] * len(replicas)
+
+    def write(self, conn: psycopg.Connection, query: str, params: Any,
+              row_factory: Any = None) -> Tuple[List[Any], Optional[str]]:
+        '''execute_write on a primary connection; the WAL position it leaves is the consistency token'''
+        if not self._key:
+            return execute_write(conn, query, params, row_factory), None
+        rows, position = pipelined_write(conn, query, params, row_factory, after_commit=WAL_POSITION)
+        return rows, self._issue(position)
+
+    def mark_written(self, conn: psycopg.Connection) -> Optional[str]:
+        '''Token for writes committed on conn outside write(), e.g. COPY imports'''
+        if not self._key:
+            return None
+        return self._issue(execute_write(conn, WAL_POSITION, None)[0][0])
+
+    def _signature(self, position: str) -> str:
+        return hmac.new(self._key, position.encode(), hashlib.sha256).hexdigest()[:32]
+
+    def _issue(self, position: str) -> str:
+        self.written = max(self.written, parse_lsn(position) or 0)
+        return f'{position}.{self._signature(position)}'
+
+    def _token_lsn(self, token: Optional[str]) -> Optional[int]:
+        if not token or not self._key:
+            return None
+        position, _, signature = token.partition('.')
+        if not hmac.compare_digest(signature.encode(), self._signature(position).encode()):
+            return None
+        return parse_lsn(position)
+
+    def verified(self, token: Optional[str]) -> Optional[str]:
+        '''The token if this router signed it, else None; garbage must not switch off caches'''
+        return token if self._token_lsn(token) is not None else None
+
+    @contextmanager
+    def connection(self, token: Optional[str] = None) -> Iterator[psycopg.Connection]:
+        required = max(self._token_lsn(token) or 0, self.written)
+        deadline = time.monotonic() + self.wait
+        for index in self._available():
+            served = False
+            try:
+                with self.replicas[index].connection(self.checkout_timeout) as conn:
+                    if not self._caught_up(index, conn, required, deadline):
+                        continue
+                    self.replica_reads += 1
+                    served = True
+                    yield conn
+                return
+            except psycopg.OperationalError:
+                # PoolTimeout is an OperationalError too
+                self._down_until[index] = time.monotonic() + self.retry_after
+                self.failovers += 1
+                if served:
+                    raise
+        self.primary_reads += 1
+        with self.primary.connection() as conn:
+            yield conn
+
+    def _available(self) -> List[int]:
+        now = time.monotonic()
+        start = self._next
+        self._next = (start + 1) % max(len(self.replicas), 1)
+        order = [(start + offset) % len(self.replicas) for offset in range(len(self.replicas))]
+        return [index for index in order if self._down_until[index] <= now]
+
+    def _caught_up(self, index: int, conn: psycopg.Connection, required: int, deadline: float) -> bool:
+        while self._replayed[index] < required:
+            with conn.cursor() as cur:
+                cur.execute(REPLAY_POSITION)
+                position = cur.fetchone()[0]
+            if position is None:
+                # not in recovery: the dsn points at a primary, which has every write
+                return True
+            self._replayed[index] = max(self._replayed[index], parse_lsn(position) or 0)
+            if self._replayed[index] >= required:
+                break
+            if time.monotonic() + REPLICA_POLL_SECONDS > deadline:
+                self.lag_fallbacks += 1
+                return False
+            time.sleep(REPLICA_POLL_SECONDS)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            'replica_reads': self.replica_reads,
+            'primary_reads': self.primary_reads,
+            'lag_fallbacks': self.lag_fallbacks,
+            'failovers': self.failovers,
+            'replicas_down': sum(1 for until in self._down_until if until > now)
+        }
+
+
+def create_pool(settings: Dict[str, Any]) -> TracedPool:
+    '''
+    Connections idle for DB_HEALTH_CHECK_IDLE seconds are health-checked on checkout;
+    all are recycled after pool_max_lifetime seconds.
+    '''
+    return TracedPool(
+        settings['dsn'],
+        min_size=settings['pool_min_size'],
+        max_size=settings['pool_max_size'],
+        max_lifetime=settings['pool_max_lifetime'],
+        max_idle=settings['pool_max_idle'],
+        check=check_idle_connection,
+        configure=configure_connection,
+        open=True
+    )
+
+
+def create_read_router(primary: TracedPool, settings: Dict[str, Any]) -> ReadRouter:
+    '''One pool per replica, sized like the primary; unreachable replicas keep reconnecting in the background'''
+    replicas = [create_pool({**settings, 'dsn': dsn}) for dsn in settings['read_dsns']]
+    return ReadRouter(
+        primary,
+        replicas,
+        wait=settings['replica_wait'],
+        retry_after=settings['replica_retry'],
+        checkout_timeout=settings['replica_checkout_timeout'],
+        secret=settings['consistency_secret']
+    )
@@ -1,15 +1,24 @@
-import json
-import os
-import jwt
 import hashlib
+import json
 from datetime import datetime, timedelta
 from typing import Dict, Any
-import psycopg
+from bootstrap import get_pool, settings
+from instrumentation import instrumented, phase
+from passwords import dummy_hash, hash_password, verify_password
+from ratelimit import client_ip, create_limiter, retry_after_header, rule_from_env
 
+# per-email login buckets stop credential stuffing against one account from many addresses
+_limiter = create_limiter({
+    'login_ip': rule_from_env('login_ip', '20/60'),
+    'login_email': rule_from_env('login_email', '5/60'),
+    'register_ip': rule_from_env('register_ip', '5/600'),
+})
+
+@instrumented(counters=lambda: {'rate_limit': _limiter.stats()})
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: User authentication - registration and login with JWT
-    Args: event with httpMethod (POST), body with action (register/login)
+    Args: event with httpMethod (POST), body with action (register/login/logout)
     Returns: HTTP response with JWT token or error
     '''
     method: str = event.get('httpMethod', 'GET')
@@ -36,130 +45,183 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     body_data = json.loads(event.get('body', '{}'))
     action = body_data.get('action')
     
-    dsn = os.environ.get('DATABASE_URL')
-    jwt_secret = os.environ.get('JWT_SECRET')
+    dsn = settings()['dsn']
+    jwt_secret = settings()['jwt_secret']
     
     if not dsn or not jwt_secret:
+        missing = [name for name, value in (('DATABASE_URL', dsn), ('JWT_SECRET', jwt_secret)) if not value]
+        print(json.dumps({'function': 'auth', 'error': 'configuration', 'missing': missing}), flush=True)
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Server configuration error', 'missing': missing})
+        }
+    
+    email_key = str(body_data.get('email') or '').strip().lower()
+    if action == 'login':
+        retry_after = _limiter.hit([('login_ip', client_ip(event)), ('login_email', email_key)])
+    elif action == 'register':
+        retry_after = _limiter.hit([('register_ip', client_ip(event))])
+    else:
+        retry_after = None
+    if retry_after:
+        return {
+            'statusCode': 429,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **retry_after_header(retry_after)},
+            'body': json.dumps({'error': 'Too many requests'})
+        }
+    
+    import jwt
+    from db import execute_write
+    
+    if action == 'register':
+        username = body_data.get('username', '').strip()
+        email = body_data.get('email', '').strip().lower()
+        password = body_data.get('password', '')
+        
+        if not username or not email or not password:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'All fields required'})
+            }
+        
+        if len(password) < 6:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Password must be at least 6 characters'})
+            }
+        
+        with phase('kdf'):
+            password_hash = hash_password(password)
+        
+        # the unique email/username constraints decide duplicates, so concurrent sign-ups cannot race
+        with get_pool().connection() as conn:
+            rows = execute_write(
+                conn,
+                "INSERT INTO t_p79167660_file_download_gaming.users (username, email, password_hash) VALUES (%s, %s, %s) ON CONFLICT DO NOTHING RETURNING id, username, email, created_at",
+                (username, email, password_hash)
+            )
+        if not rows:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'User already exists'})
+            }
+        user = rows[0]
+        
+        with phase('jwt'):
+            token = jwt.encode({
+                'user_id': user[0],
+                'username': user[1],
+                'exp': datetime.utcnow() + timedelta(days=30)
+            }, jwt_secret, algorithm='HS256')
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
             'body': json.dumps({
-                'error': 'Server configuration error',
-                'debug': {
-                    'has_dsn': bool(dsn),
-                    'has_jwt_secret': bool(jwt_secret),
-                    'env_keys': list(os.environ.keys())
+                'token': token,
+                'user': {
+                    'id': user[0],
+                    'username': user[1],
+                    'email': user[2],
+                    'created_at': user[3].isoformat()
                 }
             })
         }
     
-    with psycopg.connect(dsn) as conn:
-        with conn.cursor() as cur:
-            if action == 'register':
-                username = body_data.get('username', '').strip()
-                email = body_data.get('email', '').strip().lower()
-                password = body_data.get('password', '')
-                
-                if not username or not email or not password:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'All fields required'})
-                    }
-                
-                if len(password) < 6:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Password must be at least 6 characters'})
-                    }
-                
-                password_hash = hashlib.sha256(password.encode()).hexdigest()
-                
-                cur.execute("SELECT id FROM t_p79167660_file_download_gaming.users WHERE email = %s OR username = %s", (email, username))
-                if cur.fetchone():
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'User already exists'})
-                    }
-                
+    elif action == 'login':
+        email = body_data.get('email', '').strip().lower()
+        password = body_data.get('password', '')
+        
+        if not email or not password:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Email and password required'})
+            }
+        
+        # the connection goes back to the pool before the KDF, which holds no database state
+        with get_pool().connection() as conn:
+            with conn.cursor() as cur:
                 cur.execute(
-                    "INSERT INTO t_p79167660_file_download_gaming.users (username, email, password_hash) VALUES (%s, %s, %s) RETURNING id, username, email, created_at",
-                    (username, email, password_hash)
+                    "SELECT id, username, email, created_at, password_hash FROM t_p79167660_file_download_gaming.users WHERE email = %s AND is_active = true",
+                    (email,)
                 )
                 user = cur.fetchone()
-                conn.commit()
-                
-                token = jwt.encode({
-                    'user_id': user[0],
-                    'username': user[1],
-                    'exp': datetime.utcnow() + timedelta(days=30)
-                }, jwt_secret, algorithm='HS256')
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({
-                        'token': token,
-                        'user': {
-                            'id': user[0],
-                            'username': user[1],
-                            'email': user[2],
-                            'created_at': user[3].isoformat()
-                        }
-                    })
-                }
-            
-            elif action == 'login':
-                email = body_data.get('email', '').strip().lower()
-                password = body_data.get('password', '')
-                
-                if not email or not password:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Email and password required'})
-                    }
-                
-                password_hash = hashlib.sha256(password.encode()).hexdigest()
-                
-                cur.execute(
-                    "SELECT id, username, email, created_at FROM t_p79167660_file_download_gaming.users WHERE email = %s AND password_hash = %s AND is_active = true",
-                    (email, password_hash)
+        
+        with phase('kdf'):
+            matches, needs_rehash = verify_password(password, user[4] if user else dummy_hash())
+        if not user or not matches:
+            return {
+                'statusCode': 401,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Invalid credentials'})
+            }
+        
+        if needs_rehash:
+            with phase('kdf'):
+                new_hash = hash_password(password)
+            with get_pool().connection() as conn:
+                execute_write(
+                    conn,
+                    "UPDATE t_p79167660_file_download_gaming.users SET password_hash = %s WHERE id = %s",
+                    (new_hash, user[0])
                 )
-                user = cur.fetchone()
-                
-                if not user:
-                    return {
-                        'statusCode': 401,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Invalid credentials'})
-                    }
-                
-                token = jwt.encode({
-                    'user_id': user[0],
+        
+        with phase('jwt'):
+            token = jwt.encode({
+                'user_id': user[0],
+                'username': user[1],
+                'exp': datetime.utcnow() + timedelta(days=30)
+            }, jwt_secret, algorithm='HS256')
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({
+                'token': token,
+                'user': {
+                    'id': user[0],
                     'username': user[1],
-                    'exp': datetime.utcnow() + timedelta(days=30)
-                }, jwt_secret, algorithm='HS256')
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({
-                        'token': token,
-                        'user': {
-                            'id': user[0],
-                            'username': user[1],
-                            'email': user[2],
-                            'created_at': user[3].isoformat()
-                        }
-                    })
+                    'email': user[2],
+                    'created_at': user[3].isoformat()
                 }
-            
-            else:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Invalid action'})
-                }
\ No newline at end of file
+            })
+        }
+    
+    elif action == 'logout':
+        headers = event.get('headers') or {}
+        auth_token = headers.get('x-auth-token') or headers.get('X-Auth-Token')
+        try:
+            with phase('jwt'):
+                claims = jwt.decode(auth_token or '', jwt_secret, algorithms=['HS256'])
+        except jwt.InvalidTokenError:
+            return {
+                'statusCode': 401,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Invalid token'})
+            }
+        
+        # comments reloads this denylist periodically instead of querying it per request
+        with get_pool().connection() as conn:
+            execute_write(
+                conn,
+                "INSERT INTO t_p79167660_file_download_gaming.revoked_tokens (token_digest, expires_at) VALUES (%s, to_timestamp(%s)) ON CONFLICT (token_digest) DO NOTHING",
+                (hashlib.sha256(auth_token.encode()).hexdigest(), claims['exp'])
+            )
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'message': 'Logged out'})
+        }
+    
+    else:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Invalid action'})
+        }
\ No newline at end of file
@@ -0,0 +1,100 @@
+'''
+Business: Per-request timing of handler phases and SQL statements with structured logs
+Args: handler wrapped by @instrumented; db.TracedPool reports checkout and query time into the current trace
+Returns: handler response with a Server-Timing header; one JSON log line per request on stdout
+'''
+
+import hashlib
+import json
+import re
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+_current: ContextVar[Optional['RequestTrace']] = ContextVar('request_trace', default=None)
+_cold_start = True
+
+
+class RequestTrace:
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.queries: List[Dict[str, Any]] = []
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current.get()
+
+
+def fingerprint(query: Any) -> str:
+    text = re.sub(r'\s+', ' ', query if isinstance(query, str) else str(query)).strip()
+    return hashlib.sha1(text.encode()).hexdigest()[:12] + ' ' + text[:80]
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    trace = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            trace.add_phase(name, time.perf_counter() - started)
+
+
+def log_request(event: Dict[str, Any], context: Any, trace: RequestTrace, cold: bool, response: Dict[str, Any],
+                counters: Optional[Callable[[], Dict[str, Any]]], error: Optional[BaseException] = None) -> None:
+    record = {
+        'function': getattr(context, 'function_name', None),
+        'request_id': getattr(context, 'request_id', None),
+        'method': event.get('httpMethod'),
+        'status': response.get('statusCode'),
+        'cold_start': cold,
+        'total_ms': round((time.perf_counter() - trace.started) * 1000, 2),
+        'phases_ms': {name: round(seconds * 1000, 2) for name, seconds in trace.phases.items()},
+        'queries': trace.queries,
+        'response_bytes': len(response.get('body') or '')
+    }
+    if error is not None:
+        record['error'] = repr(error)
+    if counters is not None:
+        record['counters'] = counters()
+    print(json.dumps(record, ensure_ascii=False, default=str), file=sys.stdout, flush=True)
+
+
+def instrumented(counters: Optional[Callable[[], Dict[str, Any]]] = None) -> Callable:
+    def decorate(handler: Callable[[Dict[str, Any], Any], Dict[str, Any]]) -> Callable:
+        @wraps(handler)
+        def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+            global _cold_start
+            cold, _cold_start = _cold_start, False
+            trace = RequestTrace()
+            token = _current.set(trace)
+            try:
+                response = handler(event, context)
+            except Exception as error:
+                log_request(event, context, trace, cold, {'statusCode': 500}, counters, error)
+                raise
+            finally:
+                _current.reset(token)
+            total = time.perf_counter() - trace.started
+
+            timings = [f'total;dur={total * 1000:.1f}'] + [
+                f'{name};dur={seconds * 1000:.1f}' for name, seconds in trace.phases.items()
+            ]
+            if cold:
+                timings.append('cold')
+            headers = response.setdefault('headers', {})
+            headers['Server-Timing'] = ', '.join(timings)
+            headers['Timing-Allow-Origin'] = '*'
+
+            log_request(event, context, trace, cold, response, counters)
+            return response
+        return wrapper
+    return decorate
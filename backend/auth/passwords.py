@@ -0,0 +1,52 @@
+'''
+Business: Salted scrypt password hashing with transparent upgrade of legacy SHA-256 hashes
+Args: password - plain text, stored - value of users.password_hash
+Returns: encoded hash "scrypt$n$r$p$salt$hash" or (matches, needs_rehash) on verification
+'''
+
+import base64
+import hashlib
+import hmac
+import os
+from functools import lru_cache
+from typing import Tuple
+
+SCRYPT_N = int(os.environ.get('SCRYPT_N', '16384'))
+SCRYPT_R = int(os.environ.get('SCRYPT_R', '8'))
+SCRYPT_P = int(os.environ.get('SCRYPT_P', '1'))
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r, dklen=KEY_BYTES)
+
+
+def hash_password(password: str, n: int = SCRYPT_N, r: int = SCRYPT_R, p: int = SCRYPT_P) -> str:
+    salt = os.urandom(SALT_BYTES)
+    return f'scrypt${n}${r}${p}${_b64(salt)}${_b64(_scrypt(password, salt, n, r, p))}'
+
+
+def verify_password(password: str, stored: str) -> Tuple[bool, bool]:
+    if stored.startswith('scrypt$'):
+        try:
+            _, n, r, p, salt, expected = stored.split('$')
+            n, r, p = int(n), int(r), int(p)
+            actual = _scrypt(password, base64.b64decode(salt), n, r, p)
+        except ValueError:
+            return False, False
+        matches = hmac.compare_digest(actual, base64.b64decode(expected))
+        return matches, matches and (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    # legacy unsalted sha256 hex digest
+    matches = hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+    return matches, matches
+
+
+@lru_cache(maxsize=1)
+def dummy_hash() -> str:
+    '''Verified against when the email is unknown so both paths cost one KDF call'''
+    return hash_password('dummy-password')
@@ -0,0 +1,92 @@
+'''
+Business: Read-through cache for serialized comment responses with pluggable storage
+Args: key - cache key (e.g. comments:<file_id>), value - pre-encoded JSON bytes
+Returns: cached bytes or None; hit/miss/eviction counters via stats()
+'''
+
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class MemoryBackend:
+    '''In-process LRU with per-entry TTL, lives as long as the warm container'''
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries: 'OrderedDict[str, Tuple[float, bytes]]' = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+
+class RedisBackend:
+    '''Shared storage for several instances; any redis-py compatible client works'''
+
+    def __init__(self, client: Any):
+        self.client = client
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(key)
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        self.client.set(key, value, px=int(ttl * 1000))
+
+    def delete(self, key: str) -> None:
+        self.client.delete(key)
+
+
+class ResponseCache:
+    def __init__(self, backend: Any, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, key: str, loader: Callable[[], bytes]) -> Tuple[bytes, bool]:
+        value = self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value, True
+        self.misses += 1
+        value = loader()
+        self.backend.set(key, value, self.ttl)
+        return value, False
+
+    def invalidate(self, key: str) -> None:
+        self.backend.delete(key)
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.backend.evictions}
+
+
+def create_cache() -> ResponseCache:
+    '''Uses Redis when CACHE_REDIS_URL is set, otherwise an in-process LRU'''
+    ttl = float(os.environ.get('COMMENTS_CACHE_TTL', '30'))
+    redis_url = os.environ.get('CACHE_REDIS_URL')
+    if redis_url:
+        import redis
+        return ResponseCache(RedisBackend(redis.Redis.from_url(redis_url)), ttl)
+    max_entries = int(os.environ.get('COMMENTS_CACHE_MAX_ENTRIES', '1024'))
+    return ResponseCache(MemoryBackend(max_entries), ttl)
@@ -1,15 +1,165 @@
+import base64
+import hashlib
 import json
-import os
-import jwt
-from typing import Dict, Any, Optional
-import psycopg
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+from bootstrap import get_pool, get_read_router, read_stats, settings
+from instrumentation import instrumented, phase
+from cache import create_cache
+from tokens import create_verifier
+from ratelimit import client_ip, create_limiter, retry_after_header, rule_from_env
+from jsonrows import row_encoder
 
-def verify_token(token: str, jwt_secret: str) -> Optional[Dict]:
+_cache = create_cache()
+_tokens = create_verifier()
+_limiter = create_limiter({
+    'comment_ip': rule_from_env('comment_ip', '30/60'),
+    'comment_user': rule_from_env('comment_user', '10/60'),
+})
+
+def comments_cache_key(file_id: int) -> str:
+    return f'comments:{file_id}'
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+MAX_BATCH_FILE_IDS = 200
+
+RATING_STATS_UPSERT = """
+    INSERT INTO t_p79167660_file_download_gaming.comment_rating_stats AS s
+        (file_id, comments_count, ratings_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT (file_id) DO UPDATE SET
+        comments_count = s.comments_count + EXCLUDED.comments_count,
+        ratings_count = s.ratings_count + EXCLUDED.ratings_count,
+        rating_sum = s.rating_sum + EXCLUDED.rating_sum,
+        rating_1 = s.rating_1 + EXCLUDED.rating_1,
+        rating_2 = s.rating_2 + EXCLUDED.rating_2,
+        rating_3 = s.rating_3 + EXCLUDED.rating_3,
+        rating_4 = s.rating_4 + EXCLUDED.rating_4,
+        rating_5 = s.rating_5 + EXCLUDED.rating_5
+"""
+
+# insert and stats delta travel as one statement
+CREATE_COMMENT = f"""
+    WITH inserted AS (
+        INSERT INTO t_p79167660_file_download_gaming.comments (user_id, file_id, content, rating)
+        VALUES (%s, %s, %s, %s)
+        RETURNING id, created_at
+    ), stats AS ({RATING_STATS_UPSERT})
+    SELECT id, created_at FROM inserted
+"""
+
+# the row lock in target makes a concurrent second delete read rating = NULL, so stats drop once
+DELETE_COMMENT = """
+    WITH target AS (
+        SELECT id, file_id, rating FROM t_p79167660_file_download_gaming.comments
+        WHERE id = %s AND user_id = %s
+        FOR UPDATE
+    ), deleted AS (
+        UPDATE t_p79167660_file_download_gaming.comments c
+        SET content = '[удалено]', rating = NULL
+        FROM target
+        WHERE c.id = target.id
+        RETURNING target.file_id, target.rating
+    ), stats AS (
+        UPDATE t_p79167660_file_download_gaming.comment_rating_stats s SET
+            ratings_count = s.ratings_count - 1,
+            rating_sum = s.rating_sum - d.rating,
+            rating_1 = s.rating_1 - (d.rating = 1)::int,
+            rating_2 = s.rating_2 - (d.rating = 2)::int,
+            rating_3 = s.rating_3 - (d.rating = 3)::int,
+            rating_4 = s.rating_4 - (d.rating = 4)::int,
+            rating_5 = s.rating_5 - (d.rating = 5)::int
+        FROM deleted d
+        WHERE s.file_id = d.file_id AND d.rating IS NOT NULL
+    )
+    SELECT file_id FROM deleted
+"""
+
+def encode_cursor(created_at: datetime, comment_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), comment_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token: str) -> Optional[Tuple[datetime, int]]:
     try:
-        return jwt.decode(token, jwt_secret, algorithms=['HS256'])
-    except:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        created_at, comment_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(comment_id)
+    except (ValueError, TypeError):
         return None
 
+def rating_stats_delta(file_id: int, comments_delta: int, rating: Optional[int], sign: int) -> Tuple:
+    histogram = [sign if rating == stars else 0 for stars in range(1, 6)]
+    return (file_id, comments_delta, sign if rating else 0, sign * (rating or 0), *histogram)
+
+def fetch_rating_summary(cur, file_id: int) -> Dict[str, Any]:
+    cur.execute("""
+        SELECT comments_count, ratings_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5
+        FROM t_p79167660_file_download_gaming.comment_rating_stats
+        WHERE file_id = %s
+    """, (file_id,))
+    row = cur.fetchone() or (0, 0, 0, 0, 0, 0, 0, 0)
+    comments_count, ratings_count, rating_sum = row[:3]
+    return {
+        'comments_count': comments_count,
+        'ratings_count': ratings_count,
+        'average_rating': round(rating_sum / ratings_count, 2) if ratings_count else None,
+        'histogram': {str(stars): row[2 + stars] for stars in range(1, 6)}
+    }
+
+def load_summary(file_id: int, consistency_token: Optional[str] = None) -> bytes:
+    with get_read_router().connection(consistency_token) as conn:
+        with conn.cursor() as cur:
+            summary = fetch_rating_summary(cur, file_id)
+    return json.dumps({'summary': summary}).encode()
+
+def load_rating_batch(file_ids: Tuple[int, ...], consistency_token: Optional[str] = None) -> bytes:
+    ratings = {str(file_id): {'comments': 0, 'rating': None} for file_id in file_ids}
+    
+    with get_read_router().connection(consistency_token) as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT file_id, comments_count, ratings_count, rating_sum
+                FROM t_p79167660_file_download_gaming.comment_rating_stats
+                WHERE file_id = ANY(%s)
+            """, (list(file_ids),))
+            for file_id, comments_count, ratings_count, rating_sum in cur.fetchall():
+                ratings[str(file_id)] = {
+                    'comments': comments_count,
+                    'rating': round(rating_sum / ratings_count, 2) if ratings_count else None
+                }
+    
+    return json.dumps({'ratings': ratings}, separators=(',', ':')).encode()
+
+def load_comments(file_id: int, limit: int, position: Optional[Tuple[datetime, int]],
+                  consistency_token: Optional[str] = None) -> bytes:
+    keyset = 'AND (c.created_at, c.id) < (%s, %s)' if position else ''
+    params = (file_id, *(position or ()), limit + 1)
+    
+    with get_read_router().connection(consistency_token) as conn:
+        with conn.cursor() as cur:
+            summary = fetch_rating_summary(cur, file_id)
+            cur.execute(f"""
+                SELECT c.id, c.content, c.rating, c.created_at, c.updated_at,
+                       u.username, u.avatar_url, c.user_id
+                FROM t_p79167660_file_download_gaming.comments c
+                JOIN t_p79167660_file_download_gaming.users u ON c.user_id = u.id
+                WHERE c.file_id = %s {keyset}
+                ORDER BY c.created_at DESC, c.id DESC
+                LIMIT %s
+            """, params)
+            with phase('serialize'):
+                names = tuple(column.name for column in cur.description)
+                comments_json, last, has_more = row_encoder(names).encode_page(cur, limit)
+    
+    next_cursor = encode_cursor(last[3], last[0]) if has_more else None
+    return (
+        b'{"comments":' + comments_json
+        + b',"next_cursor":' + json.dumps(next_cursor).encode()
+        + b',"summary":' + json.dumps(summary, separators=(',', ':')).encode() + b'}'
+    )
+
+@instrumented(counters=lambda: {'cache': _cache.stats(), 'tokens': _tokens.stats(), 'rate_limit': _limiter.stats(), 'reads': read_stats()})
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Manage comments with JWT authentication - get, create, update, delete  
@@ -25,14 +175,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, X-Consistency-Token',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
         }
     
-    dsn = os.environ.get('DATABASE_URL')
-    jwt_secret = os.environ.get('JWT_SECRET')
+    dsn = settings()['dsn']
+    jwt_secret = settings()['jwt_secret']
     
     if not dsn or not jwt_secret:
         return {
@@ -41,158 +191,236 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Server configuration error'})
         }
     
-    with psycopg.connect(dsn) as conn:
-        with conn.cursor() as cur:
-            if method == 'GET':
-                query_params = event.get('queryStringParameters', {})
-                file_id = query_params.get('file_id')
-                
-                if not file_id:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'file_id required'})
-                    }
-                
-                cur.execute("""
-                    SELECT c.id, c.content, c.rating, c.created_at, c.updated_at,
-                           u.username, u.avatar_url, c.user_id
-                    FROM t_p79167660_file_download_gaming.comments c
-                    JOIN t_p79167660_file_download_gaming.users u ON c.user_id = u.id
-                    WHERE c.file_id = %s
-                    ORDER BY c.created_at DESC
-                """, (int(file_id),))
-                
-                comments = []
-                for row in cur.fetchall():
-                    comments.append({
-                        'id': row[0],
-                        'content': row[1],
-                        'rating': row[2],
-                        'created_at': row[3].isoformat(),
-                        'updated_at': row[4].isoformat(),
-                        'username': row[5],
-                        'avatar_url': row[6],
-                        'user_id': row[7]
-                    })
-                
+    if method == 'GET':
+        query_params = event.get('queryStringParameters') or {}
+        file_id = query_params.get('file_id')
+        # sent back for a while after the client's own write; such reads skip the shared cache,
+        # so only a token this deployment signed counts
+        consistency_token = headers.get('x-consistency-token') or headers.get('X-Consistency-Token')
+        consistency_token = get_read_router().verified(consistency_token)
+        
+        if query_params.get('file_ids'):
+            try:
+                file_ids = tuple(sorted({int(v) for v in query_params['file_ids'].split(',') if v.strip()}))
+            except ValueError:
+                file_ids = ()
+            if not file_ids or len(file_ids) > MAX_BATCH_FILE_IDS:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'comments': comments})
+                    'body': json.dumps({'error': f'file_ids must list 1 to {MAX_BATCH_FILE_IDS} numeric ids'})
                 }
             
-            elif method == 'POST':
-                auth_token = headers.get('x-auth-token') or headers.get('X-Auth-Token')
-                if not auth_token:
-                    return {
-                        'statusCode': 401,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Authentication required'})
-                    }
-                
-                user_data = verify_token(auth_token, jwt_secret)
-                if not user_data:
-                    return {
-                        'statusCode': 401,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Invalid token'})
-                    }
-                
-                body_data = json.loads(event.get('body', '{}'))
-                file_id = body_data.get('file_id')
-                content = body_data.get('content', '').strip()
-                rating = body_data.get('rating')
-                
-                if not file_id or not content:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'file_id and content required'})
-                    }
-                
-                if rating and (rating < 1 or rating > 5):
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'rating must be between 1 and 5'})
-                    }
-                
-                cur.execute("""
-                    INSERT INTO t_p79167660_file_download_gaming.comments (user_id, file_id, content, rating)
-                    VALUES (%s, %s, %s, %s)
-                    RETURNING id, created_at
-                """, (user_data['user_id'], int(file_id), content, rating))
-                
-                result = cur.fetchone()
-                conn.commit()
-                
-                return {
-                    'statusCode': 201,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({
-                        'id': result[0],
-                        'created_at': result[1].isoformat(),
-                        'message': 'Comment created'
-                    })
-                }
+            # keyed by the normalized id set; writes are not tracked per set, so entries expire by TTL
+            if consistency_token:
+                body, cached = load_rating_batch(file_ids, consistency_token), False
+            else:
+                body, cached = _cache.get_or_load(
+                    'ratings:' + ','.join(map(str, file_ids)),
+                    lambda: load_rating_batch(file_ids)
+                )
             
-            elif method == 'DELETE':
-                auth_token = headers.get('x-auth-token') or headers.get('X-Auth-Token')
-                if not auth_token:
-                    return {
-                        'statusCode': 401,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Authentication required'})
-                    }
-                
-                user_data = verify_token(auth_token, jwt_secret)
-                if not user_data:
-                    return {
-                        'statusCode': 401,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Invalid token'})
-                    }
-                
-                query_params = event.get('queryStringParameters', {})
-                comment_id = query_params.get('id')
-                
-                if not comment_id:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'comment id required'})
-                    }
-                
-                cur.execute("SELECT user_id FROM t_p79167660_file_download_gaming.comments WHERE id = %s", (int(comment_id),))
-                comment = cur.fetchone()
-                
-                if not comment:
-                    return {
-                        'statusCode': 404,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Comment not found'})
-                    }
-                
-                if comment[0] != user_data['user_id']:
-                    return {
-                        'statusCode': 403,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Not authorized'})
-                    }
-                
-                cur.execute("UPDATE t_p79167660_file_download_gaming.comments SET content = '[удалено]', rating = NULL WHERE id = %s", (int(comment_id),))
-                conn.commit()
-                
+            # browsers revalidate every time so a rating posted elsewhere is not hidden for a TTL;
+            # a response to a consistency token belongs to one user and is never stored
+            etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+            response_headers = {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Expose-Headers': 'ETag',
+                'Cache-Control': 'private, no-store' if consistency_token else 'no-cache',
+                'ETag': etag,
+                'X-Cache': 'HIT' if cached else 'MISS'
+            }
+            if_none_match = headers.get('if-none-match') or headers.get('If-None-Match')
+            if not consistency_token and if_none_match and etag in [tag.strip() for tag in if_none_match.split(',')]:
+                return {'statusCode': 304, 'headers': response_headers, 'body': ''}
+            return {
+                'statusCode': 200,
+                'headers': response_headers,
+                'body': body.decode()
+            }
+        
+        if not file_id:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'file_id required'})
+            }
+        
+        if query_params.get('summary'):
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': load_summary(int(file_id), consistency_token).decode()
+            }
+        
+        try:
+            limit = int(query_params.get('limit') or DEFAULT_PAGE_SIZE)
+        except ValueError:
+            limit = 0
+        if limit < 1 or limit > MAX_PAGE_SIZE:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': f'limit must be between 1 and {MAX_PAGE_SIZE}'})
+            }
+        
+        position = None
+        if query_params.get('cursor'):
+            position = decode_cursor(query_params['cursor'])
+            if not position:
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'message': 'Comment deleted'})
+                    'body': json.dumps({'error': 'Invalid cursor'})
                 }
-            
-            else:
+        
+        # only the default first page is shared by every viewer of a mod page
+        if position or limit != DEFAULT_PAGE_SIZE or consistency_token:
+            body, cached = load_comments(int(file_id), limit, position, consistency_token), False
+        else:
+            body, cached = _cache.get_or_load(
+                comments_cache_key(int(file_id)),
+                lambda: load_comments(int(file_id), limit, None)
+            )
+        
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*',
+                'X-Cache': 'HIT' if cached else 'MISS'
+            },
+            'body': body.decode()
+        }
+    
+    if method not in ('POST', 'DELETE'):
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'})
+        }
+    
+    # throttling and token checks happen before a pooled connection is taken
+    ip = client_ip(event)
+    retry_after = _limiter.hit([('comment_ip', ip)]) if method == 'POST' else None
+    if retry_after:
+        return {
+            'statusCode': 429,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **retry_after_header(retry_after)},
+            'body': json.dumps({'error': 'Too many requests'})
+        }
+    
+    auth_token = headers.get('x-auth-token') or headers.get('X-Auth-Token')
+    if not auth_token:
+        return {
+            'statusCode': 401,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Authentication required'})
+        }
+    
+    with phase('jwt'):
+        user_data = _tokens.decode(auth_token, jwt_secret)
+    if not user_data:
+        return {
+            'statusCode': 401,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Invalid token'})
+        }
+    
+    # the per-user bucket only needs the decoded claims; the denylist may need the pool
+    retry_after = _limiter.hit([('comment_user', str(user_data['user_id']))]) if method == 'POST' else None
+    if retry_after:
+        return {
+            'statusCode': 429,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **retry_after_header(retry_after)},
+            'body': json.dumps({'error': 'Too many requests'})
+        }
+    
+    with phase('jwt'):
+        revoked = _tokens.revoked(auth_token, get_pool())
+    if revoked:
+        return {
+            'statusCode': 401,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Invalid token'})
+        }
+    
+    from db import consistency_headers
+    
+    if method == 'POST':
+        body_data = json.loads(event.get('body', '{}'))
+        file_id = body_data.get('file_id')
+        content = body_data.get('content', '').strip()
+        rating = body_data.get('rating')
+        
+        if not file_id or not content:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'file_id and content required'})
+            }
+        
+        # 4.5 or true would be stored rounded but match no histogram bucket, and a later delete would underflow one
+        if rating is not None and (not isinstance(rating, int) or isinstance(rating, bool) or not 1 <= rating <= 5):
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'rating must be between 1 and 5'})
+            }
+        
+        with get_pool().connection() as conn:
+            rows, token = get_read_router().write(
+                conn, CREATE_COMMENT,
+                (user_data['user_id'], int(file_id), content, rating, *rating_stats_delta(int(file_id), 1, rating, 1))
+            )
+        result = rows[0]
+        _cache.invalidate(comments_cache_key(int(file_id)))
+        
+        return {
+            'statusCode': 201,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **consistency_headers(token)},
+            'body': json.dumps({
+                'id': result[0],
+                'created_at': result[1].isoformat(),
+                'message': 'Comment created'
+            })
+        }
+    
+    query_params = event.get('queryStringParameters', {})
+    comment_id = query_params.get('id')
+    
+    if not comment_id:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'comment id required'})
+        }
+    
+    with get_pool().connection() as conn:
+        deleted, token = get_read_router().write(conn, DELETE_COMMENT, (int(comment_id), user_data['user_id']))
+        
+        if not deleted:
+            # failure path only: tell a missing comment from someone else's
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1 FROM t_p79167660_file_download_gaming.comments WHERE id = %s", (int(comment_id),))
+                exists = cur.fetchone()
+            if not exists:
                 return {
-                    'statusCode': 405,
+                    'statusCode': 404,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Method not allowed'})
-                }
\ No newline at end of file
+                    'body': json.dumps({'error': 'Comment not found'})
+                }
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Not authorized'})
+            }
+    
+    _cache.invalidate(comments_cache_key(deleted[0][0]))
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **consistency_headers(token)},
+        'body': json.dumps({'message': 'Comment deleted'})
+    }
\ No newline at end of file
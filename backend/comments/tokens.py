@@ -0,0 +1,92 @@
+'''
+Business: Cached JWT verification with a periodically refreshed revocation denylist
+Args: token - value of X-Auth-Token, jwt_secret; pool for revoked() - connects only when the denylist is due for refresh
+Returns: decoded claims or None, revoked() True/False; decode time saved by the cache via stats()
+'''
+
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenVerifier:
+    def __init__(self, max_entries: int, denylist_refresh: float):
+        self.max_entries = max_entries
+        self.denylist_refresh = denylist_refresh
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.decodes = 0
+        self.decode_seconds = 0.0
+        self._claims: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._denylist: Set[str] = set()
+        self._denylist_loaded_at: Optional[float] = None
+
+    def refresh_denylist(self, pool: Any) -> None:
+        if self._denylist_loaded_at is not None and time.monotonic() - self._denylist_loaded_at < self.denylist_refresh:
+            return
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT token_digest FROM t_p79167660_file_download_gaming.revoked_tokens WHERE expires_at > CURRENT_TIMESTAMP"
+                )
+                self._denylist = {row[0] for row in cur.fetchall()}
+        self._denylist_loaded_at = time.monotonic()
+        for digest in self._denylist:
+            self._claims.pop(digest, None)
+
+    def revoked(self, token: str, pool: Any) -> bool:
+        self.refresh_denylist(pool)
+        return token_digest(token) in self._denylist
+
+    def decode(self, token: str, jwt_secret: str) -> Optional[Dict[str, Any]]:
+        '''Signature and expiry only, without touching the database; callers check revoked() before acting'''
+        digest = token_digest(token)
+        claims = self._claims.get(digest)
+        if claims is not None:
+            if claims.get('exp', 0) > time.time():
+                self.hits += 1
+                self._claims.move_to_end(digest)
+                return claims
+            del self._claims[digest]
+
+        import jwt
+
+        self.misses += 1
+        started = time.perf_counter()
+        try:
+            claims = jwt.decode(token, jwt_secret, algorithms=['HS256'])
+        except jwt.InvalidTokenError:
+            return None
+        finally:
+            self.decodes += 1
+            self.decode_seconds += time.perf_counter() - started
+
+        self._claims[digest] = claims
+        while len(self._claims) > self.max_entries:
+            self._claims.popitem(last=False)
+            self.evictions += 1
+        return claims
+
+    def stats(self) -> Dict[str, Any]:
+        average = self.decode_seconds / self.decodes if self.decodes else 0.0
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'decode_ms_avg': round(average * 1000, 3),
+            'decode_ms_saved': round(average * self.hits * 1000, 3)
+        }
+
+
+def create_verifier() -> TokenVerifier:
+    return TokenVerifier(
+        max_entries=int(os.environ.get('TOKEN_CACHE_MAX_ENTRIES', '4096')),
+        denylist_refresh=float(os.environ.get('TOKEN_DENYLIST_REFRESH', '30'))
+    )
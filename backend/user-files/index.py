@@ -5,15 +5,172 @@ Args: event - dict с httpMethod, body, queryStringParameters
 Returns: HTTP response dict с данными файлов
 '''
 
+import base64
 import json
-import os
-from typing import Dict, Any, Optional
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from bootstrap import get_pool, get_read_router, read_stats
+from instrumentation import instrumented, phase
+from downloads import create_counter
+from snapshots import create_store
+from ingest import PayloadError, decode_payload, import_files, missing_field, parse_records, payload_format
+from rankings import DECAY_WEIGHT, create_refresher
+from ratelimit import client_ip, create_limiter, retry_after_header, rule_from_env
+from jsonrows import row_encoder
 
-def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MIN_SEARCH_LENGTH = 2
 
+FILE_COLUMNS = '''
+    uf.id,
+    uf.name,
+    uf.game,
+    uf.content_type,
+    uf.download_type,
+    uf.mod_type,
+    uf.size,
+    uf.version,
+    uf.file_url,
+    uf.file_type,
+    uf.downloads,
+    uf.created_at,
+    COALESCE(u.username, uf.author_name, 'Аноним') as author
+'''
+
+# query parameter -> column; each has a (column, created_at DESC, id DESC) index
+FILTER_COLUMNS = (
+    ('game', 'game'),
+    ('content_type', 'content_type'),
+    ('mod_type', 'mod_type'),
+)
+
+# read mode -> ranking table and the fields it adds to each file; both are ordered by (score DESC, file_id DESC)
+RANKING_SOURCES = {
+    'trending': ('file_trending', f'ROUND((r.score / {DECAY_WEIGHT})::numeric, 2)::float8 AS trending_score'),
+    'top_rated': ('file_top_rated', 'r.average_rating::float8 AS average_rating, r.ratings_count'),
+}
+SORT_MODES = ('latest', *RANKING_SOURCES)
+# selected for keyset paging only, never sent to clients
+PAGING_COLUMNS = ('rank', 'rank_score')
+
+_downloads = create_counter()
+_snapshots = create_store()
+_rankings = create_refresher()
+_limiter = create_limiter({
+    'upload_ip': rule_from_env('upload_ip', '10/600'),
+    'import_ip': rule_from_env('import_ip', '5/3600'),
+    'download_ip': rule_from_env('download_ip', '60/60'),
+})
+
+def encode_cursor(sort_key: Any, file_id: int) -> str:
+    raw = json.dumps([sort_key, file_id], default=lambda value: value.isoformat()).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token: str, sort_type: Callable[[Any], Any]) -> Optional[Tuple[Any, int]]:
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        sort_key, file_id = json.loads(raw)
+        return sort_type(sort_key), int(file_id)
+    except (ValueError, TypeError):
+        return None
+
+def error_response(status: int, message: str) -> Dict[str, Any]:
+    return {
+        'statusCode': status,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'isBase64Encoded': False,
+        'body': json.dumps({'error': message})
+    }
+
+def too_many_requests(retry_after: float) -> Dict[str, Any]:
+    response = error_response(429, 'Слишком много запросов, попробуйте позже')
+    response['headers'].update(retry_after_header(retry_after))
+    return response
+
+def build_filters(query_params: Dict[str, Any]) -> Tuple[List[str], List[Any]]:
+    conditions = []
+    params = []
+    for param, column in FILTER_COLUMNS:
+        value = query_params.get(param)
+        if value:
+            conditions.append(f'uf.{column} = %s')
+            params.append(value)
+    return conditions, params
+
+@lru_cache(maxsize=64)
+def latest_files_sql(conditions: Tuple[str, ...], keyset: bool) -> str:
+    if keyset:
+        conditions += ('(uf.created_at, uf.id) < (%s, %s)',)
+    where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    return f'''
+        SELECT {FILE_COLUMNS}
+        FROM t_p79167660_file_download_gaming.user_files uf
+        LEFT JOIN t_p79167660_file_download_gaming.users u ON uf.user_id = u.id
+        {where_clause}
+        ORDER BY uf.created_at DESC, uf.id DESC
+        LIMIT %s
+    '''
+
+def latest_files_query(conditions: List[str], params: List[Any], position: Optional[Tuple[datetime, int]], limit: int) -> Tuple[str, List[Any]]:
+    return latest_files_sql(tuple(conditions), bool(position)), [*params, *(position or ()), limit + 1]
+
+@lru_cache(maxsize=64)
+def search_files_sql(conditions: Tuple[str, ...], keyset: bool) -> str:
+    '''
+    Full-text match on search_vector (GIN) or trigram similarity on name/game/author_name
+    (gin_trgm_ops) so typos still find results; ranked by ts_rank_cd + similarity, widened to
+    float8 so the rank in a cursor compares equal to the row it came from.
+    '''
+    filter_clause = ''.join(f' AND {condition}' for condition in conditions)
+    keyset_clause = 'WHERE (ranked.rank, ranked.id) < (%s, %s)' if keyset else ''
+    return f'''
+        SELECT * FROM (
+            SELECT {FILE_COLUMNS},
+                (ts_rank_cd(uf.search_vector, q.tsq) + similarity(uf.name, q.text))::float8 AS rank
+            FROM t_p79167660_file_download_gaming.user_files uf
+            CROSS JOIN (SELECT websearch_to_tsquery('simple', %s) AS tsq, %s::text AS text) q
+            LEFT JOIN t_p79167660_file_download_gaming.users u ON uf.user_id = u.id
+            WHERE (
+                uf.search_vector @@ q.tsq
+                OR uf.name %% q.text
+                OR uf.game %% q.text
+                OR uf.author_name %% q.text
+            ){filter_clause}
+        ) ranked
+        {keyset_clause}
+        ORDER BY ranked.rank DESC, ranked.id DESC
+        LIMIT %s
+    '''
+
+def search_files_query(search_query: str, conditions: List[str], params: List[Any], position: Optional[Tuple[float, int]], limit: int) -> Tuple[str, List[Any]]:
+    sql = search_files_sql(tuple(conditions), bool(position))
+    return sql, [search_query, search_query, *params, *(position or ()), limit + 1]
+
+@lru_cache(maxsize=64)
+def ranked_files_sql(sort: str, conditions: Tuple[str, ...], keyset: bool) -> str:
+    table, extra_columns = RANKING_SOURCES[sort]
+    if keyset:
+        conditions += ('(r.score, r.file_id) < (%s, %s)',)
+    where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    return f'''
+        SELECT {FILE_COLUMNS}, r.score AS rank_score, {extra_columns}
+        FROM t_p79167660_file_download_gaming.{table} r
+        JOIN t_p79167660_file_download_gaming.user_files uf ON uf.id = r.file_id
+        LEFT JOIN t_p79167660_file_download_gaming.users u ON uf.user_id = u.id
+        {where_clause}
+        ORDER BY r.score DESC, r.file_id DESC
+        LIMIT %s
+    '''
+
+def ranked_files_query(sort: str, conditions: List[str], params: List[Any], position: Optional[Tuple[float, int]], limit: int) -> Tuple[str, List[Any]]:
+    return ranked_files_sql(sort, tuple(conditions), bool(position)), [*params, *(position or ()), limit + 1]
+
+@instrumented(counters=lambda: {'pending_downloads': _downloads.pending_total, 'rate_limit': _limiter.stats(), 'reads': read_stats()})
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -23,44 +180,84 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, If-None-Match, X-Consistency-Token',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
         }
     
     if method == 'GET':
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cur.execute('''
-            SELECT 
-                uf.id,
-                uf.name,
-                uf.game,
-                uf.content_type,
-                uf.download_type,
-                uf.mod_type,
-                uf.size,
-                uf.version,
-                uf.file_url,
-                uf.file_type,
-                uf.downloads,
-                uf.created_at,
-                COALESCE(u.username, uf.author_name, 'Аноним') as author
-            FROM t_p79167660_file_download_gaming.user_files uf
-            LEFT JOIN t_p79167660_file_download_gaming.users u ON uf.user_id = u.id
-            ORDER BY uf.created_at DESC
-        ''')
+        query_params = event.get('queryStringParameters') or {}
+        headers = event.get('headers') or {}
+        # sent back for a while after the client's own write; such reads skip the shared snapshots,
+        # so only a token this deployment signed counts
+        consistency_token = headers.get('x-consistency-token') or headers.get('X-Consistency-Token')
+        consistency_token = get_read_router().verified(consistency_token)
+        
+        try:
+            limit = int(query_params.get('limit') or DEFAULT_PAGE_SIZE)
+        except ValueError:
+            return error_response(400, 'Параметр limit должен быть числом')
+        if limit < 1 or limit > MAX_PAGE_SIZE:
+            return error_response(400, f'Параметр limit должен быть от 1 до {MAX_PAGE_SIZE}')
+        
+        search_query = (query_params.get('q') or '').strip()
+        if search_query and len(search_query) < MIN_SEARCH_LENGTH:
+            return error_response(400, f'Поисковый запрос должен содержать минимум {MIN_SEARCH_LENGTH} символа')
+        
+        sort = query_params.get('sort') or 'latest'
+        if sort not in SORT_MODES:
+            return error_response(400, f"Параметр sort должен быть одним из: {', '.join(SORT_MODES)}")
+        if search_query and sort != 'latest':
+            return error_response(400, 'Поиск не сочетается с параметром sort')
+        
+        position = None
+        cursor_token = query_params.get('cursor')
+        if cursor_token:
+            position = decode_cursor(cursor_token, datetime.fromisoformat if sort == 'latest' and not search_query else float)
+            if not position:
+                return error_response(400, 'Некорректный cursor')
         
-        files = cur.fetchall()
-        cur.close()
-        conn.close()
+        snapshot_key = None
+        if not search_query and not consistency_token:
+            # the sort rides after the filter values; invalidate_matching only compares the filters
+            filter_values = (*(query_params.get(param) or None for param, _ in FILTER_COLUMNS), sort)
+            snapshot_key = (filter_values, limit, cursor_token or '')
+            snapshot = _snapshots.get(snapshot_key)
+            if snapshot:
+                return snapshot.response(headers)
         
-        files_list = [dict(f) for f in files]
-        for f in files_list:
-            if f['created_at']:
-                f['created_at'] = f['created_at'].isoformat()
+        # after the snapshot lookup, so cached pages never build the pool or wait for a refresh
+        if sort in RANKING_SOURCES:
+            _rankings.maybe_refresh(get_pool())
+        
+        conditions, params = build_filters(query_params)
+        if search_query:
+            query, params = search_files_query(search_query, conditions, params, position, limit)
+            sort_column = 'rank'
+        elif sort in RANKING_SOURCES:
+            query, params = ranked_files_query(sort, conditions, params, position, limit)
+            sort_column = 'rank_score'
+        else:
+            query, params = latest_files_query(conditions, params, position, limit)
+            sort_column = 'created_at'
+        
+        with get_read_router().connection(consistency_token) as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, params)
+                names = tuple(column.name for column in cur.description)
+                with phase('serialize'):
+                    files_json, last, has_more = row_encoder(names, PAGING_COLUMNS).encode_page(cur, limit)
+        
+        next_cursor = None
+        if has_more:
+            next_cursor = encode_cursor(last[names.index(sort_column)], last[names.index('id')])
+        body = b'{"files":' + files_json + b',"next_cursor":' + json.dumps(next_cursor).encode() + b'}'
+        
+        if snapshot_key:
+            with phase('compress'):
+                snapshot = _snapshots.build(snapshot_key, body, next_cursor)
+            return snapshot.response(headers)
         
         return {
             'statusCode': 200,
@@ -69,50 +266,100 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'Access-Control-Allow-Origin': '*'
             },
             'isBase64Encoded': False,
-            'body': json.dumps({'files': files_list})
+            'body': body.decode()
         }
     
     if method == 'POST':
+        query_params = event.get('queryStringParameters') or {}
+        if query_params.get('action') == 'import':
+            retry_after = _limiter.hit([('import_ip', client_ip(event))])
+            if retry_after:
+                return too_many_requests(retry_after)
+            
+            fmt = payload_format(query_params, event.get('headers') or {})
+            
+            try:
+                payload = decode_payload(event)
+                with phase('ingest'):
+                    with get_pool().connection() as conn:
+                        report, affected = import_files(conn, parse_records(payload, fmt))
+                        token = get_read_router().mark_written(conn)
+            except PayloadError as error:
+                return error_response(400, str(error))
+            
+            from db import consistency_headers
+            
+            for values in affected:
+                _snapshots.invalidate_matching(values)
+            
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*',
+                    **consistency_headers(token)
+                },
+                'isBase64Encoded': False,
+                'body': json.dumps({'success': True, 'format': fmt, **report})
+            }
+        
         body_data = json.loads(event.get('body', '{}'))
         
-        required_fields = ['name', 'game', 'contentType', 'size', 'version', 'fileUrl', 'authorName']
-        for field in required_fields:
-            if not body_data.get(field):
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'error': f'Поле {field} обязательно'})
-                }
-        
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cur.execute('''
-            INSERT INTO t_p79167660_file_download_gaming.user_files 
-            (user_id, name, game, content_type, download_type, mod_type, size, version, file_url, file_type, author_name)
-            VALUES (NULL, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            RETURNING id, name, created_at
-        ''', (
-            body_data['name'],
-            body_data['game'],
-            body_data['contentType'],
-            body_data.get('downloadType'),
-            body_data.get('modType'),
-            body_data['size'],
-            body_data['version'],
-            body_data['fileUrl'],
-            body_data.get('fileType', 'direct'),
-            body_data['authorName']
-        ))
-        
-        result = cur.fetchone()
-        conn.commit()
-        cur.close()
-        conn.close()
+        if body_data.get('action') == 'download':
+            # every accepted click feeds the trending scores, so one address cannot inflate them at will
+            retry_after = _limiter.hit([('download_ip', client_ip(event))])
+            if retry_after:
+                return too_many_requests(retry_after)
+            
+            try:
+                file_id = int(body_data.get('fileId'))
+            except (TypeError, ValueError):
+                return error_response(400, 'Поле fileId обязательно')
+            
+            _downloads.add(get_pool(), file_id)
+            
+            return {
+                'statusCode': 202,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'isBase64Encoded': False,
+                'body': json.dumps({'success': True})
+            }
+        
+        field = missing_field(body_data)
+        if field:
+            return error_response(400, f'Поле {field} обязательно')
+        
+        retry_after = _limiter.hit([('upload_ip', client_ip(event))])
+        if retry_after:
+            return too_many_requests(retry_after)
+        
+        from psycopg.rows import dict_row
+        from db import consistency_headers
+        
+        with get_pool().connection() as conn:
+            rows, token = get_read_router().write(conn, '''
+                INSERT INTO t_p79167660_file_download_gaming.user_files 
+                (user_id, name, game, content_type, download_type, mod_type, size, version, file_url, file_type, author_name)
+                VALUES (NULL, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING id, name, created_at
+            ''', (
+                body_data['name'],
+                body_data['game'],
+                body_data['contentType'],
+                body_data.get('downloadType'),
+                body_data.get('modType'),
+                body_data['size'],
+                body_data['version'],
+                body_data['fileUrl'],
+                body_data.get('fileType', 'direct'),
+                body_data['authorName']
+            ), row_factory=dict_row)
+        result = rows[0]
+        
+        _snapshots.invalidate_matching((body_data['game'], body_data['contentType'], body_data.get('modType')))
         
         result_dict = dict(result)
         if result_dict.get('created_at'):
@@ -122,7 +369,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'statusCode': 201,
             'headers': {
                 'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
+                'Access-Control-Allow-Origin': '*',
+                **consistency_headers(token)
             },
             'isBase64Encoded': False,
             'body': json.dumps({
@@ -131,12 +379,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             })
         }
     
-    return {
-        'statusCode': 405,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
-        },
-        'isBase64Encoded': False,
-        'body': json.dumps({'error': 'Метод не поддерживается'})
-    }
\ No newline at end of file
+    return error_response(405, 'Метод не поддерживается')
\ No newline at end of file
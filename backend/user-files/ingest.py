@@ -0,0 +1,170 @@
+'''
+Business: Bulk import of partner mod catalogs into user_files - COPY into staging, then a merge deduplicated on file_url
+Args: payload - NDJSON or CSV text with the same fields as a single upload; conn - psycopg connection
+Returns: per-row report (inserted, duplicates, errors) with the ingestion rate in rows/sec
+'''
+
+import base64
+import csv
+import io
+import json
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+IMPORT_LOCK_ID = 7916766002
+MAX_IMPORT_ROWS = int(os.environ.get('IMPORT_MAX_ROWS', '5000'))
+
+REQUIRED_FIELDS = ('name', 'game', 'contentType', 'size', 'version', 'fileUrl', 'authorName')
+
+# payload field -> (user_files column, VARCHAR limit from V0004)
+IMPORT_COLUMNS = (
+    ('name', 'name', 255),
+    ('game', 'game', 100),
+    ('contentType', 'content_type', 50),
+    ('downloadType', 'download_type', 50),
+    ('modType', 'mod_type', 50),
+    ('size', 'size', 50),
+    ('version', 'version', 50),
+    ('fileUrl', 'file_url', None),
+    ('fileType', 'file_type', 20),
+    ('authorName', 'author_name', 100),
+)
+COLUMN_NAMES = ', '.join(column for _, column, _ in IMPORT_COLUMNS)
+FILE_URL_INDEX = [field for field, _, _ in IMPORT_COLUMNS].index('fileUrl')
+FILE_TYPE_INDEX = [field for field, _, _ in IMPORT_COLUMNS].index('fileType')
+
+STAGING_TABLE = f'''
+    CREATE TEMP TABLE user_files_import (
+        row_no INTEGER NOT NULL,
+        {', '.join(f'{column} TEXT' for _, column, _ in IMPORT_COLUMNS)}
+    ) ON COMMIT DROP
+'''
+
+# files already listed under the same file_url are skipped; the advisory lock serializes concurrent imports
+MERGE_IMPORT = f'''
+    INSERT INTO t_p79167660_file_download_gaming.user_files (user_id, {COLUMN_NAMES})
+    SELECT NULL, {', '.join(f's.{column}' for _, column, _ in IMPORT_COLUMNS)}
+    FROM user_files_import s
+    WHERE NOT EXISTS (
+        SELECT 1 FROM t_p79167660_file_download_gaming.user_files uf WHERE uf.file_url = s.file_url
+    )
+    ORDER BY s.row_no
+    RETURNING file_url, game, content_type, mod_type
+'''
+
+
+class PayloadError(ValueError):
+    pass
+
+
+def missing_field(data: Dict[str, Any]) -> Optional[str]:
+    for field in REQUIRED_FIELDS:
+        if not data.get(field):
+            return field
+    return None
+
+
+def payload_format(query_params: Dict[str, Any], headers: Dict[str, Any]) -> str:
+    requested = (query_params.get('format') or '').lower()
+    content_type = (headers.get('content-type') or headers.get('Content-Type') or '').lower()
+    if requested == 'csv' or (not requested and 'csv' in content_type):
+        return 'csv'
+    return 'ndjson'
+
+
+def decode_payload(event: Dict[str, Any]) -> str:
+    payload = event.get('body') or ''
+    if not event.get('isBase64Encoded'):
+        return payload
+    try:
+        return base64.b64decode(payload, validate=True).decode('utf-8')
+    except ValueError:
+        # binascii.Error and UnicodeDecodeError are both ValueErrors
+        raise PayloadError('Тело запроса должно быть base64 с текстом в UTF-8')
+
+
+def parse_records(payload: str, fmt: str) -> Iterator[Tuple[int, Any]]:
+    '''Yields (line number, record); records that cannot be parsed come back as None'''
+    if fmt == 'csv':
+        reader = csv.DictReader(io.StringIO(payload))
+        try:
+            for record in reader:
+                yield reader.line_num, record
+        except csv.Error as error:
+            raise PayloadError(f'Некорректный CSV в строке {reader.line_num}: {error}')
+        return
+    for line_no, line in enumerate(payload.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield line_no, record if isinstance(record, dict) else None
+
+
+def validate(record: Any) -> Tuple[Optional[Tuple[Optional[str], ...]], Optional[str]]:
+    if record is None:
+        return None, 'Строка не является JSON-объектом'
+    field = missing_field(record)
+    if field:
+        return None, f'Поле {field} обязательно'
+    values = []
+    for field, _, limit in IMPORT_COLUMNS:
+        value = record.get(field)
+        value = str(value) if value not in (None, '') else None
+        if value and limit and len(value) > limit:
+            return None, f'Поле {field} длиннее {limit} символов'
+        values.append(value)
+    values[FILE_TYPE_INDEX] = values[FILE_TYPE_INDEX] or 'direct'
+    return tuple(values), None
+
+
+def import_files(conn: Any, records: Iterator[Tuple[int, Any]]) -> Tuple[Dict[str, Any], Set[Tuple[Optional[str], ...]]]:
+    '''
+    Valid rows are streamed through COPY as they are parsed, so the payload is never
+    held as a list of dicts. Returns the report and the (game, content_type, mod_type)
+    values of inserted files for snapshot invalidation.
+    '''
+    started = time.perf_counter()
+    received = 0
+    errors: List[Dict[str, Any]] = []
+    duplicates: List[int] = []
+    row_by_url: Dict[str, int] = {}
+
+    with conn.cursor() as cur:
+        cur.execute(STAGING_TABLE)
+        with cur.copy(f'COPY user_files_import (row_no, {COLUMN_NAMES}) FROM STDIN') as copy:
+            for row_no, record in records:
+                received += 1
+                if received > MAX_IMPORT_ROWS:
+                    raise PayloadError(f'Не больше {MAX_IMPORT_ROWS} строк за один импорт')
+                values, error = validate(record)
+                if error:
+                    errors.append({'row': row_no, 'error': error})
+                    continue
+                file_url = values[FILE_URL_INDEX]
+                if file_url in row_by_url:
+                    duplicates.append(row_no)
+                    continue
+                row_by_url[file_url] = row_no
+                copy.write_row((row_no, *values))
+
+        cur.execute('SELECT pg_advisory_xact_lock(%s)', (IMPORT_LOCK_ID,))
+        cur.execute(MERGE_IMPORT)
+        inserted = cur.fetchall()
+    conn.commit()
+
+    inserted_urls = {row[0] for row in inserted}
+    duplicates.extend(row_no for file_url, row_no in row_by_url.items() if file_url not in inserted_urls)
+    elapsed = time.perf_counter() - started
+    report = {
+        'received': received,
+        'inserted': len(inserted),
+        'duplicates': sorted(duplicates),
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(received / elapsed, 1) if elapsed else None
+    }
+    return report, {tuple(row[1:]) for row in inserted}
@@ -0,0 +1,111 @@
+'''
+Business: Trending and top-rated rankings for the catalog - incremental refresh of file_trending and file_top_rated
+Args: a psycopg connection pool; refreshes run from cron via scripts/refresh_rankings.py, or piggyback on
+      ranking reads when RANKINGS_REFRESH_ON_READ=1
+Returns: nothing - ranking reads page through the refreshed tables by (score, file_id)
+'''
+
+import os
+import time
+from typing import Any, Optional
+
+RANKINGS_REFRESH_LOCK_ID = 7916766003
+TRENDING_HALF_LIFE_HOURS = float(os.environ.get('TRENDING_HALF_LIFE_HOURS', '72'))
+# the epoch moves forward once weights reach 2^REBASE_DOUBLINGS; float8 overflows past 2^1024
+REBASE_DOUBLINGS = 32
+# after a rebase, scores worth less than one download aged this many half-lives become 0 instead of underflowing
+NEGLIGIBLE_DOUBLINGS = 64
+
+DECAY_EPOCH = "(SELECT decay_epoch FROM t_p79167660_file_download_gaming.ranking_refreshes WHERE name = 'rankings')"
+DECAY_DOUBLINGS = f'EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - {DECAY_EPOCH}) / 3600 / {TRENDING_HALF_LIFE_HOURS}'
+# weight of a download counted now, relative to the stored epoch
+DECAY_WEIGHT = f'power(2, {DECAY_DOUBLINGS})'
+
+# only files whose counter grew since the last refresh are written
+REFRESH_TRENDING = f'''
+    INSERT INTO t_p79167660_file_download_gaming.file_trending AS t (file_id, score, downloads_seen, updated_at)
+    SELECT uf.id, uf.downloads * {DECAY_WEIGHT}, uf.downloads, CURRENT_TIMESTAMP
+    FROM t_p79167660_file_download_gaming.user_files uf
+    LEFT JOIN t_p79167660_file_download_gaming.file_trending seen ON seen.file_id = uf.id
+    WHERE uf.downloads > COALESCE(seen.downloads_seen, 0)
+    ORDER BY uf.id
+    ON CONFLICT (file_id) DO UPDATE SET
+        score = t.score + (EXCLUDED.downloads_seen - t.downloads_seen) * {DECAY_WEIGHT},
+        downloads_seen = EXCLUDED.downloads_seen,
+        updated_at = EXCLUDED.updated_at
+'''
+
+
+class RankingRefresher:
+    '''
+    A cron job runs scripts/refresh_rankings.py every interval seconds: a
+    refresh rescans the downloads and ratings of every file, which no reader
+    should wait for. Only with RANKINGS_REFRESH_ON_READ=1 (deployments without
+    cron) does a ranking read that missed the snapshots check every interval
+    seconds whether the shared refreshed_at is older than interval and, if so,
+    refresh under an advisory lock. Concurrent readers keep serving the previous
+    rankings: the top-rated view is refreshed CONCURRENTLY.
+
+    Once trending weights reach 2^REBASE_DOUBLINGS the refresh moves decay_epoch
+    to now and divides every stored score by the same factor before adding new
+    downloads, all in one transaction, so readers never see mixed epochs.
+    '''
+
+    def __init__(self, interval: float, on_read: bool = False):
+        self.interval = interval
+        self.on_read = on_read
+        self.last_check = 0.0
+
+    def maybe_refresh(self, pool: Any) -> None:
+        if not self.on_read or time.monotonic() - self.last_check < self.interval:
+            return
+        self.last_check = time.monotonic()
+        self.refresh(pool)
+
+    def refresh(self, pool: Any, force: bool = False) -> bool:
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute('SELECT pg_try_advisory_xact_lock(%s)', (RANKINGS_REFRESH_LOCK_ID,))
+                if not cur.fetchone()[0]:
+                    return False
+                cur.execute(
+                    f"SELECT refreshed_at > CURRENT_TIMESTAMP - make_interval(secs => %s), {DECAY_DOUBLINGS} FROM t_p79167660_file_download_gaming.ranking_refreshes WHERE name = 'rankings'",
+                    (self.interval,)
+                )
+                row = cur.fetchone()
+                if row and row[0] and not force:
+                    return False
+                if row and row[1] >= REBASE_DOUBLINGS:
+                    rebase_trending(cur, float(row[1]))
+                cur.execute(REFRESH_TRENDING)
+                cur.execute('REFRESH MATERIALIZED VIEW CONCURRENTLY t_p79167660_file_download_gaming.file_top_rated')
+                cur.execute(
+                    "UPDATE t_p79167660_file_download_gaming.ranking_refreshes SET refreshed_at = CURRENT_TIMESTAMP WHERE name = 'rankings'"
+                )
+        return True
+
+
+def rebase_trending(cur: Any, doublings: float) -> None:
+    '''Moves decay_epoch to the transaction timestamp and rescales scores by 2^-doublings'''
+    cutoff: Optional[float] = None
+    if doublings < 1024 - NEGLIGIBLE_DOUBLINGS:
+        cutoff = 2.0 ** (doublings - NEGLIGIBLE_DOUBLINGS)
+    if cutoff is None:
+        # everything counted before the old epoch has decayed beyond float8 precision
+        cur.execute('UPDATE t_p79167660_file_download_gaming.file_trending SET score = 0 WHERE score <> 0')
+    else:
+        # products stay at or above 2^-NEGLIGIBLE_DOUBLINGS, so PostgreSQL never reports an underflow
+        cur.execute(
+            'UPDATE t_p79167660_file_download_gaming.file_trending SET score = CASE WHEN score < %s THEN 0 ELSE score * %s END WHERE score <> 0',
+            (cutoff, 2.0 ** -doublings)
+        )
+    cur.execute(
+        "UPDATE t_p79167660_file_download_gaming.ranking_refreshes SET decay_epoch = CURRENT_TIMESTAMP WHERE name = 'rankings'"
+    )
+
+
+def create_refresher() -> RankingRefresher:
+    return RankingRefresher(
+        interval=float(os.environ.get('RANKINGS_REFRESH_INTERVAL', '300')),
+        on_read=os.environ.get('RANKINGS_REFRESH_ON_READ', '0') == '1'
+    )
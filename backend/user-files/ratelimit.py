@@ -0,0 +1,137 @@
+'''
+Business: Token-bucket throttling keyed by client IP, user id or email, checked before any database work
+Args: rules - name -> (capacity, seconds to refill it); hit() gets (rule, key) pairs for one request
+Returns: None when allowed or seconds until a retry can succeed; allowed/rejected counters via stats()
+'''
+
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+Rule = Tuple[float, float]
+
+# atomic refill-and-take on the shared bucket; Redis TIME keeps instances on one clock
+SHARED_BUCKET_SCRIPT = '''
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = math.min(capacity, (tonumber(bucket[1]) or capacity) + (now - (tonumber(bucket[2]) or now)) * rate)
+local retry = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return tostring(retry)
+'''
+
+
+def client_ip(event: Dict[str, Any]) -> str:
+    identity = (event.get('requestContext') or {}).get('identity') or {}
+    if identity.get('sourceIp'):
+        return identity['sourceIp']
+    headers = event.get('headers') or {}
+    forwarded = headers.get('x-forwarded-for') or headers.get('X-Forwarded-For') or ''
+    # the rightmost entry is added by the gateway in front of the function; a client can put anything before it
+    return forwarded.split(',')[-1].strip() or 'unknown'
+
+
+def rule_from_env(name: str, default: str) -> Rule:
+    '''RATE_LIMIT_<NAME>="capacity/seconds", e.g. "10/60" - ten requests, refilled over a minute'''
+    capacity, seconds = os.environ.get(f'RATE_LIMIT_{name.upper()}', default).split('/')
+    return float(capacity), float(seconds)
+
+
+class RateLimiter:
+    '''
+    Every warm container keeps its own buckets, so an empty local bucket rejects
+    without any network call. With a shared client, requests the local bucket
+    allows also take a token from the Redis bucket, which sees traffic spread over
+    all instances; if Redis is unreachable the local decision stands.
+    '''
+
+    def __init__(self, rules: Dict[str, Rule], max_keys: int, shared: Any = None, enabled: bool = True):
+        self.rules = rules
+        self.enabled = enabled
+        self.max_keys = max_keys
+        self.shared = shared
+        self._script = shared.register_script(SHARED_BUCKET_SCRIPT) if shared is not None else None
+        self._buckets: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+        self.allowed = 0
+        self.rejected: Dict[str, int] = {}
+        self.shared_errors = 0
+
+    def _take_local(self, rule: str, key: str) -> float:
+        capacity, seconds = self.rules[rule]
+        rate = capacity / seconds
+        now = time.monotonic()
+        bucket_key = f'{rule}:{key}'
+        tokens, updated = self._buckets.get(bucket_key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / rate
+        self._buckets[bucket_key] = (tokens, now)
+        self._buckets.move_to_end(bucket_key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+    def _take_shared(self, rule: str, key: str) -> float:
+        capacity, seconds = self.rules[rule]
+        try:
+            return float(self._script(keys=[f'ratelimit:{rule}:{key}'], args=[capacity, capacity / seconds]))
+        except Exception:
+            self.shared_errors += 1
+            return 0.0
+
+    def hit(self, keys: Iterable[Tuple[str, Optional[str]]]) -> Optional[float]:
+        '''Takes a token per (rule, key), broadest key first; stops at the first empty bucket'''
+        if not self.enabled:
+            return None
+        for rule, key in keys:
+            if not key:
+                continue
+            retry_after = self._take_local(rule, key)
+            if not retry_after and self._script is not None:
+                retry_after = self._take_shared(rule, key)
+            if retry_after:
+                self.rejected[rule] = self.rejected.get(rule, 0) + 1
+                return retry_after
+        self.allowed += 1
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'allowed': self.allowed,
+            'rejected': dict(self.rejected),
+            'buckets': len(self._buckets),
+            'shared_errors': self.shared_errors
+        }
+
+
+def retry_after_header(retry_after: float) -> Dict[str, str]:
+    return {'Retry-After': str(max(1, math.ceil(retry_after))), 'Access-Control-Expose-Headers': 'Retry-After'}
+
+
+def create_limiter(rules: Dict[str, Rule]) -> RateLimiter:
+    '''Buckets are shared through Redis when RATE_LIMIT_REDIS_URL is set; RATE_LIMIT_ENABLED=0 turns throttling off'''
+    redis_url = os.environ.get('RATE_LIMIT_REDIS_URL')
+    shared = None
+    if redis_url:
+        import redis
+        shared = redis.Redis.from_url(redis_url, socket_timeout=0.05)
+    return RateLimiter(
+        rules,
+        max_keys=int(os.environ.get('RATE_LIMIT_MAX_KEYS', '10000')),
+        shared=shared,
+        enabled=os.environ.get('RATE_LIMIT_ENABLED', '1') != '0'
+    )
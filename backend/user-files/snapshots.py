@@ -0,0 +1,127 @@
+'''
+Business: Pre-encoded, compressed catalog pages with ETag revalidation
+Args: key - (filters, limit, cursor) of a listing request, raw - encoded JSON body
+Returns: Snapshot with identity/gzip/brotli bodies and a strong ETag
+'''
+
+import base64
+import gzip
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+SnapshotKey = Tuple[Tuple[Optional[str], ...], int, str]
+
+
+@lru_cache(maxsize=1)
+def brotli_module() -> Any:
+    '''Imported on the first snapshot build instead of at cold start; None when not installed'''
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+class Snapshot:
+    def __init__(self, raw: bytes, next_cursor: Optional[str], depth: int):
+        self.raw = raw
+        self.next_cursor = next_cursor
+        self.depth = depth
+        self.etag = '"' + hashlib.sha1(raw).hexdigest()[:20] + '"'
+        self.created_at = time.monotonic()
+        self.encoded: Dict[str, bytes] = {'gzip': gzip.compress(raw, compresslevel=6)}
+        brotli = brotli_module()
+        if brotli is not None:
+            self.encoded['br'] = brotli.compress(raw, quality=5)
+
+    def response(self, request_headers: Dict[str, str]) -> Dict[str, Any]:
+        # clients revalidate every time: a fresh upload or a consistency token must reach the function,
+        # and an unchanged page still costs only a 304
+        headers = {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Expose-Headers': 'ETag',
+            'Cache-Control': 'no-cache',
+            'ETag': self.etag,
+            'Vary': 'Accept-Encoding'
+        }
+        if_none_match = request_headers.get('if-none-match') or request_headers.get('If-None-Match')
+        if if_none_match and self.etag in [tag.strip() for tag in if_none_match.split(',')]:
+            return {'statusCode': 304, 'headers': headers, 'isBase64Encoded': False, 'body': ''}
+
+        accept_encoding = (request_headers.get('accept-encoding') or request_headers.get('Accept-Encoding') or '').lower()
+        for encoding in ('br', 'gzip'):
+            if encoding in self.encoded and encoding in accept_encoding:
+                headers['Content-Encoding'] = encoding
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'isBase64Encoded': True,
+                    'body': base64.b64encode(self.encoded[encoding]).decode()
+                }
+        return {'statusCode': 200, 'headers': headers, 'isBase64Encoded': False, 'body': self.raw.decode()}
+
+
+class SnapshotStore:
+    '''
+    Keeps the first max_pages pages of each filter combination. Page n+1 is
+    recognised by the next_cursor that page n handed out. An insert only
+    drops the filter combinations the new file belongs to; other instances
+    catch up when their entries reach ttl. Filter tuples may carry extra
+    trailing entries (the sort mode) that invalidation does not compare.
+    '''
+
+    def __init__(self, max_pages: int, ttl: int, max_entries: int):
+        self.max_pages = max_pages
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._snapshots: 'OrderedDict[SnapshotKey, Snapshot]' = OrderedDict()
+        self._cursor_depth: Dict[Tuple[Tuple[Optional[str], ...], int, str], int] = {}
+
+    def depth_for(self, key: SnapshotKey) -> Optional[int]:
+        filters, limit, cursor = key
+        if not cursor:
+            return 0
+        return self._cursor_depth.get((filters, limit, cursor))
+
+    def get(self, key: SnapshotKey) -> Optional[Snapshot]:
+        snapshot = self._snapshots.get(key)
+        if snapshot and time.monotonic() - snapshot.created_at < self.ttl:
+            return snapshot
+        return None
+
+    def build(self, key: SnapshotKey, raw: bytes, next_cursor: Optional[str]) -> Snapshot:
+        depth = self.depth_for(key)
+        snapshot = Snapshot(raw, next_cursor, depth if depth is not None else self.max_pages)
+        if snapshot.depth < self.max_pages:
+            self._snapshots[key] = snapshot
+            self._snapshots.move_to_end(key)
+            while len(self._snapshots) > self.max_entries:
+                (filters, limit, _), evicted = self._snapshots.popitem(last=False)
+                self._cursor_depth.pop((filters, limit, evicted.next_cursor or ''), None)
+            if next_cursor and snapshot.depth + 1 < self.max_pages:
+                filters, limit, _ = key
+                self._cursor_depth[(filters, limit, next_cursor)] = snapshot.depth + 1
+        return snapshot
+
+    def invalidate_matching(self, values: Tuple[Optional[str], ...]) -> None:
+        '''Drops every filter combination that would list a file with these column values'''
+        def matches(filters: Tuple[Optional[str], ...]) -> bool:
+            return all(wanted is None or wanted == value for wanted, value in zip(filters, values))
+
+        for key in [k for k in self._snapshots if matches(k[0])]:
+            del self._snapshots[key]
+        for key in [k for k in self._cursor_depth if matches(k[0])]:
+            del self._cursor_depth[key]
+
+
+def create_store() -> SnapshotStore:
+    return SnapshotStore(
+        max_pages=int(os.environ.get('SNAPSHOT_PAGES', '3')),
+        ttl=int(os.environ.get('SNAPSHOT_TTL', '30')),
+        max_entries=int(os.environ.get('SNAPSHOT_MAX_ENTRIES', '512'))
+    )
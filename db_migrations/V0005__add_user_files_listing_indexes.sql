@@ -0,0 +1,10 @@
+-- Keyset pagination needs a non-null sort key
+UPDATE t_p79167660_file_download_gaming.user_files SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+ALTER TABLE t_p79167660_file_download_gaming.user_files ALTER COLUMN created_at SET NOT NULL;
+
+-- Composite indexes matching ORDER BY created_at DESC, id DESC with optional equality filters
+CREATE INDEX IF NOT EXISTS idx_user_files_created ON t_p79167660_file_download_gaming.user_files(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_user_files_game_created ON t_p79167660_file_download_gaming.user_files(game, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_user_files_content_type_created ON t_p79167660_file_download_gaming.user_files(content_type, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_user_files_mod_type_created ON t_p79167660_file_download_gaming.user_files(mod_type, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_user_files_game_content_type_created ON t_p79167660_file_download_gaming.user_files(game, content_type, created_at DESC, id DESC);
@@ -0,0 +1,32 @@
+-- Per-file comment count and rating histogram, maintained by the comments function
+CREATE TABLE IF NOT EXISTS t_p79167660_file_download_gaming.comment_rating_stats (
+    file_id INTEGER PRIMARY KEY,
+    comments_count INTEGER NOT NULL DEFAULT 0,
+    ratings_count INTEGER NOT NULL DEFAULT 0,
+    rating_sum INTEGER NOT NULL DEFAULT 0,
+    rating_1 INTEGER NOT NULL DEFAULT 0,
+    rating_2 INTEGER NOT NULL DEFAULT 0,
+    rating_3 INTEGER NOT NULL DEFAULT 0,
+    rating_4 INTEGER NOT NULL DEFAULT 0,
+    rating_5 INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT INTO t_p79167660_file_download_gaming.comment_rating_stats
+    (file_id, comments_count, ratings_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5)
+SELECT file_id,
+       COUNT(*),
+       COUNT(rating),
+       COALESCE(SUM(rating), 0),
+       COUNT(*) FILTER (WHERE rating = 1),
+       COUNT(*) FILTER (WHERE rating = 2),
+       COUNT(*) FILTER (WHERE rating = 3),
+       COUNT(*) FILTER (WHERE rating = 4),
+       COUNT(*) FILTER (WHERE rating = 5)
+FROM t_p79167660_file_download_gaming.comments
+GROUP BY file_id
+ON CONFLICT (file_id) DO NOTHING;
+
+-- Keyset pagination of comments per file
+UPDATE t_p79167660_file_download_gaming.comments SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+ALTER TABLE t_p79167660_file_download_gaming.comments ALTER COLUMN created_at SET NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_comments_file_created ON t_p79167660_file_download_gaming.comments(file_id, created_at DESC, id DESC);
@@ -0,0 +1,9 @@
+UPDATE t_p79167660_file_download_gaming.user_files SET downloads = 0 WHERE downloads IS NULL;
+ALTER TABLE t_p79167660_file_download_gaming.user_files ALTER COLUMN downloads SET NOT NULL;
+
+-- Append-only download clicks, rolled up into user_files.downloads by the user-files function
+CREATE TABLE IF NOT EXISTS t_p79167660_file_download_gaming.download_events (
+    id BIGSERIAL PRIMARY KEY,
+    file_id INTEGER NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
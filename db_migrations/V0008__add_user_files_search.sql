@@ -0,0 +1,14 @@
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Maintained by Postgres on every insert/update; 'simple' config because names mix Russian and English
+ALTER TABLE t_p79167660_file_download_gaming.user_files
+  ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(game, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce(author_name, '')), 'C')
+  ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_user_files_search_vector ON t_p79167660_file_download_gaming.user_files USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_user_files_name_trgm ON t_p79167660_file_download_gaming.user_files USING GIN (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_user_files_game_trgm ON t_p79167660_file_download_gaming.user_files USING GIN (game gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_user_files_author_name_trgm ON t_p79167660_file_download_gaming.user_files USING GIN (author_name gin_trgm_ops);
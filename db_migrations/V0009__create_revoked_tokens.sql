@@ -0,0 +1,8 @@
+-- Denylist of revoked JWTs (sha256 of the token); rows are irrelevant once expires_at passes
+CREATE TABLE IF NOT EXISTS t_p79167660_file_download_gaming.revoked_tokens (
+    token_digest CHAR(64) PRIMARY KEY,
+    expires_at TIMESTAMP NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_revoked_tokens_expires_at ON t_p79167660_file_download_gaming.revoked_tokens(expires_at);
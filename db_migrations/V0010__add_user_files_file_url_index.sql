@@ -0,0 +1,2 @@
+-- Bulk imports skip files whose file_url is already listed; hash suits equality lookups on long URLs
+CREATE INDEX IF NOT EXISTS idx_user_files_file_url ON t_p79167660_file_download_gaming.user_files USING hash (file_url);
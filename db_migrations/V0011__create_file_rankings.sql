@@ -0,0 +1,39 @@
+-- Trending: downloads weighted by 2^(hours since 2025-01-01 / half-life) when they are counted ("forward decay"),
+-- so older downloads lose weight relative to new ones without rewriting rows that got no new downloads
+CREATE TABLE IF NOT EXISTS t_p79167660_file_download_gaming.file_trending (
+    file_id INTEGER PRIMARY KEY,
+    score DOUBLE PRECISION NOT NULL DEFAULT 0,
+    downloads_seen INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_file_trending_score ON t_p79167660_file_download_gaming.file_trending(score DESC, file_id DESC);
+
+-- Top rated: Bayesian average pulling files with few ratings towards the catalog mean (prior weight 10)
+CREATE MATERIALIZED VIEW IF NOT EXISTS t_p79167660_file_download_gaming.file_top_rated AS
+WITH prior AS (
+    SELECT COALESCE(SUM(rating_sum)::float8 / NULLIF(SUM(ratings_count), 0), 3.0) AS mean
+    FROM t_p79167660_file_download_gaming.comment_rating_stats
+)
+SELECT s.file_id,
+       s.ratings_count,
+       ROUND(s.rating_sum::numeric / s.ratings_count, 2) AS average_rating,
+       (10 * prior.mean + s.rating_sum) / (10 + s.ratings_count) AS score
+FROM t_p79167660_file_download_gaming.comment_rating_stats s
+JOIN t_p79167660_file_download_gaming.user_files uf ON uf.id = s.file_id
+CROSS JOIN prior
+WHERE s.ratings_count > 0;
+
+-- REFRESH ... CONCURRENTLY needs a unique index
+CREATE UNIQUE INDEX IF NOT EXISTS idx_file_top_rated_file_id ON t_p79167660_file_download_gaming.file_top_rated(file_id);
+CREATE INDEX IF NOT EXISTS idx_file_top_rated_score ON t_p79167660_file_download_gaming.file_top_rated(score DESC, file_id DESC);
+
+-- Shared refresh timestamp so warm instances do not all refresh within one interval
+CREATE TABLE IF NOT EXISTS t_p79167660_file_download_gaming.ranking_refreshes (
+    name VARCHAR(50) PRIMARY KEY,
+    refreshed_at TIMESTAMP NOT NULL
+);
+
+INSERT INTO t_p79167660_file_download_gaming.ranking_refreshes (name, refreshed_at)
+VALUES ('rankings', TIMESTAMP '1970-01-01')
+ON CONFLICT (name) DO NOTHING;
@@ -0,0 +1,6 @@
+-- Incremental analytics exports read rows after a (created_at, id) watermark
+UPDATE t_p79167660_file_download_gaming.users SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+ALTER TABLE t_p79167660_file_download_gaming.users ALTER COLUMN created_at SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_users_created ON t_p79167660_file_download_gaming.users(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_comments_created ON t_p79167660_file_download_gaming.comments(created_at, id);
@@ -0,0 +1,4 @@
+-- Trending scores are stored relative to decay_epoch; the refresh moves the epoch forward and rescales
+-- file_trending in the same transaction, so 2^(hours since epoch / half-life) never overflows float8
+ALTER TABLE t_p79167660_file_download_gaming.ranking_refreshes
+    ADD COLUMN IF NOT EXISTS decay_epoch TIMESTAMP NOT NULL DEFAULT TIMESTAMP '2025-01-01';
@@ -0,0 +1,50 @@
+'''
+Business: Measure login verification throughput for the auth password KDF
+Args: --n/--r/--p scrypt cost parameters, --seconds per run, --threads for the multi-core run
+Returns: prints logins/sec on one core and across threads, plus memory per hash
+'''
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'auth'))
+
+from passwords import hash_password, verify_password  # noqa: E402
+
+
+def run(stored: str, seconds: float) -> int:
+    done = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        verify_password('correct horse battery', stored)
+        done += 1
+    return done
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n', type=int, default=int(os.environ.get('SCRYPT_N', '16384')))
+    parser.add_argument('--r', type=int, default=int(os.environ.get('SCRYPT_R', '8')))
+    parser.add_argument('--p', type=int, default=int(os.environ.get('SCRYPT_P', '1')))
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    stored = hash_password('correct horse battery', args.n, args.r, args.p)
+    print(f'scrypt n={args.n} r={args.r} p={args.p}, {128 * args.n * args.r / 2 ** 20:.1f} MiB per hash')
+
+    single = run(stored, args.seconds) / args.seconds
+    print(f'1 thread:  {single:8.1f} logins/sec/core ({1000 / single:.1f} ms per verification)')
+
+    # hashlib.scrypt releases the GIL, so threads scale with cores
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        total = sum(executor.map(lambda _: run(stored, args.seconds), range(args.threads)))
+    rate = total / args.seconds
+    print(f'{args.threads} threads: {rate:8.1f} logins/sec ({rate / args.threads:.1f} per thread)')
+
+
+if __name__ == '__main__':
+    main()
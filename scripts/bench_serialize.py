@@ -0,0 +1,125 @@
+'''
+Business: Compare JSON encoding of a user-files page - dict rows + isoformat + json.dumps versus jsonrows
+Args: --rows per response, --repeat encodes per variant, --variants to run (dicts, template, orjson)
+Returns: prints MB/s, rows/s, response bytes and the tracemalloc peak of one encode for each variant, each measured
+         in a fresh interpreter; the stdlib template variant is the fallback when orjson is missing and runs slower
+         than dicts, whose json.dumps is the C encoder
+'''
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Any, Dict
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+RESULT_MARKER = '@@serialize '
+
+PROBE = '''
+import json, os, sys, time, tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, {directory!r})
+variant, rows_count, repeat = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+os.environ['JSON_ENCODER'] = 'json' if variant == 'template' else 'orjson'
+import jsonrows
+
+names = ('id', 'name', 'game', 'content_type', 'download_type', 'mod_type', 'size', 'version',
+         'file_url', 'file_type', 'downloads', 'created_at', 'author', 'rank')
+started_at = datetime(2025, 1, 1)
+rows = [
+    (i, f'Мод номер {{i}}', 'Minecraft', 'mod', 'direct', None if i % 3 else 'gameplay', '100 MB', '1.0',
+     f'https://example.com/files/{{i}}.zip', 'direct', i * 7, started_at - timedelta(seconds=i), f'Автор {{i % 100}}', i / 3)
+    for i in range(rows_count)
+]
+
+
+class Cursor:
+    """Serves the prepared tuples the way a client-side psycopg cursor does"""
+    def __init__(self):
+        self.position = 0
+
+    def fetchall(self):
+        # dict_row builds a dict per row at fetch time
+        return [dict(zip(names, row)) for row in rows]
+
+    def fetchmany(self, size):
+        batch = rows[self.position:self.position + size]
+        self.position += size
+        return batch
+
+
+def encode_dicts():
+    files = Cursor().fetchall()
+    files_list = [dict(f) for f in files]
+    for f in files_list:
+        f.pop('rank', None)
+        if f['created_at']:
+            f['created_at'] = f['created_at'].isoformat()
+    return json.dumps({{'files': files_list, 'next_cursor': None}}).encode()
+
+
+def encode_rows():
+    files_json, _, _ = jsonrows.row_encoder(names, ('rank',)).encode_page(Cursor(), rows_count)
+    return b'{{"files":' + files_json + b',"next_cursor":null}}'
+
+
+encode = encode_dicts if variant == 'dicts' else encode_rows
+if variant == 'orjson' and jsonrows.orjson_module() is None:
+    print({marker!r} + json.dumps({{'error': 'orjson is not installed'}}))
+    sys.exit(0)
+
+started = time.perf_counter()
+for _ in range(repeat):
+    body = encode()
+elapsed = time.perf_counter() - started
+
+# traced separately: tracemalloc slows allocation down and would skew the timing
+del body
+tracemalloc.start()
+peak = 0
+for _ in range(5):
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    body = encode()
+    peak = max(peak, tracemalloc.get_traced_memory()[1] - baseline)
+    del body
+tracemalloc.stop()
+print({marker!r} + json.dumps({{
+    'bytes': len(encode()),
+    'seconds': elapsed,
+    'peak_kb': peak // 1024
+}}))
+'''.format(directory=os.path.join(ROOT, 'backend', 'user-files'), marker=RESULT_MARKER)
+
+
+def probe(variant: str, rows: int, repeat: int) -> Dict[str, Any]:
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE, variant, str(rows), str(repeat)],
+        capture_output=True, text=True, check=True
+    ).stdout
+    line = next(line for line in output.splitlines() if line.startswith(RESULT_MARKER))
+    return json.loads(line[len(RESULT_MARKER):])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=200, help='rows per response; MAX_PAGE_SIZE is 200')
+    parser.add_argument('--repeat', type=int, default=500)
+    parser.add_argument('--variants', nargs='*', default=['dicts', 'template', 'orjson'])
+    args = parser.parse_args()
+
+    for variant in args.variants:
+        result = probe(variant, args.rows, args.repeat)
+        if 'error' in result:
+            print(f"{variant:9} skipped: {result['error']}")
+            continue
+        total_bytes = result['bytes'] * args.repeat
+        print(f"{variant:9} {total_bytes / result['seconds'] / 1e6:8.1f} MB/s  "
+              f"{args.rows * args.repeat / result['seconds']:10.0f} rows/s  "
+              f"{result['bytes']:9d} bytes/response  peak {result['peak_kb']} KB/encode")
+
+
+if __name__ == '__main__':
+    main()
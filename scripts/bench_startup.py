@@ -0,0 +1,115 @@
+'''
+Business: Measure cold-start cost of each function - module import, first OPTIONS and first real request
+Args: --runs fresh interpreters per function, --dsn to include the first database request,
+      --import-budget-ms / --first-request-budget-ms to fail when the median exceeds the budget
+Returns: prints median timings per function and which heavy modules were loaded by each stage
+'''
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+FUNCTIONS = ('auth', 'comments', 'user-files')
+HEAVY_MODULES = ('psycopg', 'psycopg_pool', 'jwt', 'brotli', 'redis', 'concurrent.futures')
+RESULT_MARKER = '@@startup '
+
+PROBE = '''
+import importlib.util, json, os, sys, time
+from types import SimpleNamespace
+
+directory, first_event = sys.argv[1], json.loads(sys.argv[2])
+heavy = {heavy!r}
+context = SimpleNamespace(request_id='startup', function_name=os.path.basename(directory))
+
+started = time.perf_counter()
+sys.path.insert(0, directory)
+spec = importlib.util.spec_from_file_location('index', os.path.join(directory, 'index.py'))
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+imported = time.perf_counter()
+after_import = [m for m in heavy if m in sys.modules]
+
+module.handler({{'httpMethod': 'OPTIONS', 'headers': {{}}}}, context)
+options_done = time.perf_counter()
+after_options = [m for m in heavy if m in sys.modules]
+
+first_request_ms = None
+if first_event:
+    module.handler(first_event, context)
+    first_request_ms = (time.perf_counter() - options_done) * 1000
+
+print({marker!r} + json.dumps({{
+    'import_ms': (imported - started) * 1000,
+    'options_ms': (options_done - imported) * 1000,
+    'first_request_ms': first_request_ms,
+    'after_import': after_import,
+    'after_options': after_options
+}}))
+'''.format(heavy=HEAVY_MODULES, marker=RESULT_MARKER)
+
+
+def first_event(function: str) -> Dict[str, Any]:
+    with open(os.path.join(BACKEND, function, 'tests.json'), encoding='utf-8') as f:
+        test = json.load(f)['tests'][0]
+    return {
+        'httpMethod': test.get('method', 'GET'),
+        'headers': test.get('headers') or {},
+        'queryStringParameters': test.get('queryStringParameters') or {},
+        'body': json.dumps(test['body']) if 'body' in test else '{}'
+    }
+
+
+def probe(function: str, with_request: bool) -> Dict[str, Any]:
+    event = first_event(function) if with_request else {}
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE, os.path.join(BACKEND, function), json.dumps(event)],
+        capture_output=True, text=True, check=True, env=os.environ.copy()
+    ).stdout
+    line = next(line for line in output.splitlines() if line.startswith(RESULT_MARKER))
+    return json.loads(line[len(RESULT_MARKER):])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--functions', nargs='*', default=list(FUNCTIONS))
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'), help='database for the first real request; skipped when empty')
+    parser.add_argument('--import-budget-ms', type=float, default=100.0)
+    parser.add_argument('--first-request-budget-ms', type=float, default=500.0)
+    args = parser.parse_args()
+
+    if args.dsn:
+        os.environ['DATABASE_URL'] = args.dsn
+        os.environ.setdefault('JWT_SECRET', 'startup-secret')
+
+    over_budget: List[str] = []
+    for function in args.functions:
+        runs = [probe(function, bool(args.dsn)) for _ in range(args.runs)]
+        import_ms = statistics.median(r['import_ms'] for r in runs)
+        options_ms = statistics.median(r['options_ms'] for r in runs)
+        line = f'{function:12} import {import_ms:7.1f}ms  OPTIONS {options_ms:6.2f}ms'
+        if args.dsn:
+            first_ms = statistics.median(r['first_request_ms'] for r in runs)
+            line += f'  first request {first_ms:7.1f}ms'
+            if first_ms > args.first_request_budget_ms:
+                over_budget.append(f'{function}: first request {first_ms:.1f}ms > {args.first_request_budget_ms}ms')
+        if import_ms > args.import_budget_ms:
+            over_budget.append(f'{function}: import {import_ms:.1f}ms > {args.import_budget_ms}ms')
+        print(line)
+        print(f"{'':12} heavy modules after import: {runs[0]['after_import'] or '-'}, after OPTIONS: {runs[0]['after_options'] or '-'}")
+
+    if over_budget:
+        print('OVER BUDGET:')
+        for problem in over_budget:
+            print(f'  {problem}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+'''
+Business: Export users, user_files and comments to compressed Parquet chunks for offline analytics
+Args: --dsn (EXPORT_DATABASE_URL or DATABASE_URL, ideally a replica), --out directory, --chunk-rows per file,
+      --lag-seconds to leave recent rows for the next run, --full to ignore the saved watermarks
+Returns: writes <out>/<table>/part-<run>-<n>.parquet and <out>/watermarks.json; prints rows and rows/sec per table
+
+A run writes into <out>/.staging-<run>/ and becomes visible only once it is complete: the staging directory is
+renamed to .committed-<run>, then its parts and watermarks are moved into place. The next run deletes leftover
+staging directories, whose parts the unchanged watermarks would export again, and finishes committed ones.
+'''
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+SCHEMA = 't_p79167660_file_download_gaming'
+WATERMARKS_FILE = 'watermarks.json'
+STAGING_PREFIX = '.staging-'
+COMMITTED_PREFIX = '.committed-'
+
+# columns and types as created by db_migrations (V0001, V0003, V0004); password_hash and
+# the generated search_vector stay out of analytics copies
+EXPORT_TABLES: Dict[str, List[Tuple[str, str]]] = {
+    'users': [
+        ('id', 'int32'), ('username', 'string'), ('email', 'string'), ('created_at', 'timestamp'),
+        ('avatar_url', 'string'), ('is_active', 'bool')
+    ],
+    'user_files': [
+        ('id', 'int32'), ('user_id', 'int32'), ('name', 'string'), ('game', 'string'),
+        ('content_type', 'string'), ('download_type', 'string'), ('mod_type', 'string'), ('size', 'string'),
+        ('version', 'string'), ('file_url', 'string'), ('file_type', 'string'), ('downloads', 'int32'),
+        ('created_at', 'timestamp'), ('author_name', 'string')
+    ],
+    'comments': [
+        ('id', 'int32'), ('user_id', 'int32'), ('file_id', 'int32'), ('content', 'string'),
+        ('rating', 'int32'), ('created_at', 'timestamp'), ('updated_at', 'timestamp')
+    ],
+}
+
+
+def arrow_schema(columns: List[Tuple[str, str]]) -> Any:
+    import pyarrow as pa
+
+    types = {'int32': pa.int32(), 'string': pa.string(), 'timestamp': pa.timestamp('us'), 'bool': pa.bool_()}
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+
+def load_watermarks(path: str) -> Dict[str, Tuple[str, int]]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return {table: (mark[0], mark[1]) for table, mark in json.load(f).items()}
+
+
+def save_watermarks(path: str, watermarks: Dict[str, Tuple[str, int]]) -> None:
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(watermarks, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def publish(out_dir: str, run_dir: str) -> None:
+    '''
+    Moves a committed run's parts into place, then its watermarks. Safe to repeat after a crash:
+    parts already moved are simply no longer in run_dir.
+    '''
+    for table in sorted(os.listdir(run_dir)):
+        staged = os.path.join(run_dir, table)
+        if not os.path.isdir(staged):
+            continue
+        os.makedirs(os.path.join(out_dir, table), exist_ok=True)
+        for name in sorted(os.listdir(staged)):
+            os.replace(os.path.join(staged, name), os.path.join(out_dir, table, name))
+    staged_watermarks = os.path.join(run_dir, WATERMARKS_FILE)
+    if os.path.exists(staged_watermarks):
+        os.replace(staged_watermarks, os.path.join(out_dir, WATERMARKS_FILE))
+    shutil.rmtree(run_dir)
+
+
+def recover(out_dir: str) -> None:
+    '''Finishes runs that committed before a crash and drops the parts of runs that never did'''
+    for name in sorted(os.listdir(out_dir)):
+        path = os.path.join(out_dir, name)
+        if name.startswith(COMMITTED_PREFIX):
+            print(f'finishing committed run {name[len(COMMITTED_PREFIX):]}')
+            publish(out_dir, path)
+        elif name.startswith(STAGING_PREFIX):
+            print(f'removing parts of failed run {name[len(STAGING_PREFIX):]}')
+            shutil.rmtree(path)
+
+
+def export_table(conn: Any, table: str, out_dir: str, run_id: str, chunk_rows: int, lag_seconds: int,
+                 since: Optional[Tuple[str, int]], compression: str) -> Tuple[int, Optional[Tuple[str, int]]]:
+    '''
+    Streams rows newer than the (created_at, id) watermark through a server-side cursor,
+    chunk_rows at a time, so client memory is bounded by one chunk whatever the table size.
+    '''
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = EXPORT_TABLES[table]
+    schema = arrow_schema(columns)
+    names = [name for name, _ in columns]
+    conditions = ['created_at < CURRENT_TIMESTAMP - make_interval(secs => %s)']
+    params: List[Any] = [lag_seconds]
+    if since:
+        conditions.append('(created_at, id) > (%s, %s)')
+        params.extend([datetime.fromisoformat(since[0]), since[1]])
+
+    table_dir = os.path.join(out_dir, table)
+    os.makedirs(table_dir, exist_ok=True)
+    exported = 0
+    last: Optional[Tuple[str, int]] = None
+    created_at_index, id_index = names.index('created_at'), names.index('id')
+
+    with conn.cursor(name=f'export_{table}') as cur:
+        cur.itersize = chunk_rows
+        cur.execute(f'''
+            SELECT {', '.join(names)} FROM {SCHEMA}.{table}
+            WHERE {' AND '.join(conditions)}
+            ORDER BY created_at, id
+        ''', params)
+        part = 0
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if not rows:
+                break
+            batch = pa.RecordBatch.from_arrays(
+                [pa.array([row[i] for row in rows], type=schema.field(i).type) for i in range(len(names))],
+                schema=schema
+            )
+            path = os.path.join(table_dir, f'part-{run_id}-{part:05d}.parquet')
+            pq.write_table(pa.Table.from_batches([batch]), path + '.tmp', compression=compression)
+            os.replace(path + '.tmp', path)
+            exported += len(rows)
+            last = (rows[-1][created_at_index].isoformat(), rows[-1][id_index])
+            part += 1
+    return exported, last
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--dsn', default=os.environ.get('EXPORT_DATABASE_URL') or os.environ.get('DATABASE_URL'))
+    parser.add_argument('--out', default='export')
+    parser.add_argument('--tables', nargs='*', default=list(EXPORT_TABLES))
+    parser.add_argument('--chunk-rows', type=int, default=50000)
+    parser.add_argument('--lag-seconds', type=int, default=300,
+                        help='rows younger than this may still be in uncommitted transactions with earlier created_at')
+    parser.add_argument('--compression', default='zstd')
+    parser.add_argument('--full', action='store_true', help='ignore saved watermarks and export everything; point --out at an empty directory')
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error('--dsn, EXPORT_DATABASE_URL or DATABASE_URL is required')
+    unknown = set(args.tables) - set(EXPORT_TABLES)
+    if unknown:
+        parser.error(f'unknown tables: {", ".join(sorted(unknown))}')
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        sys.exit('pyarrow is required: pip install pyarrow')
+
+    import psycopg
+
+    os.makedirs(args.out, exist_ok=True)
+    recover(args.out)
+    watermarks = {} if args.full else load_watermarks(os.path.join(args.out, WATERMARKS_FILE))
+    run_id = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+    run_dir = os.path.join(args.out, STAGING_PREFIX + run_id)
+    os.makedirs(run_dir)
+
+    try:
+        with psycopg.connect(args.dsn) as conn:
+            # one read-only snapshot for all tables keeps comments consistent with the users and files they reference
+            conn.isolation_level = psycopg.IsolationLevel.REPEATABLE_READ
+            conn.read_only = True
+            for table in args.tables:
+                started = time.perf_counter()
+                exported, last = export_table(
+                    conn, table, run_dir, run_id, args.chunk_rows, args.lag_seconds, watermarks.get(table), args.compression
+                )
+                elapsed = time.perf_counter() - started
+                if last:
+                    watermarks[table] = last
+                print(f'{table:12} {exported:10d} rows  {exported / elapsed if elapsed else 0:10.0f} rows/s  '
+                      f'watermark {watermarks.get(table)}')
+        save_watermarks(os.path.join(run_dir, WATERMARKS_FILE), watermarks)
+    except BaseException:
+        shutil.rmtree(run_dir, ignore_errors=True)
+        raise
+
+    # the rename is the commit point; a crash after it is finished by the next run's recover()
+    committed_dir = os.path.join(args.out, COMMITTED_PREFIX + run_id)
+    os.replace(run_dir, committed_dir)
+    publish(args.out, committed_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,383 @@
+'''
+Business: Replay each function's tests.json at fixed concurrency against a local Postgres and report latency
+Args: --dsn of a disposable Postgres, --users/--files/--comments to seed, --concurrency, --requests per scenario,
+      --update-baseline to record results, --check to fail when results regress against the baseline
+      (the first --check on a machine records it)
+Returns: prints p50/p95/p99, requests/sec and DB round-trips per request for every scenario
+'''
+
+import argparse
+import copy
+import importlib.util
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+from weakref import WeakKeyDictionary
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+MIGRATIONS = os.path.join(ROOT, 'db_migrations')
+SCHEMA = 't_p79167660_file_download_gaming'
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'loadtest_baseline.json')
+FUNCTIONS = ('auth', 'comments', 'user-files')
+
+_local = threading.local()
+
+
+class ProtocolCounter:
+    '''
+    Follows the backend side of one connection message by message (type byte, int32 length)
+    without buffering payloads, and counts ReadyForQuery ('Z'): the server sends exactly one per
+    Sync or simple Query, so each marks a client wait on the network.
+    '''
+
+    def __init__(self) -> None:
+        self.header = b''
+        self.skip = 0
+        self.ready = 0
+
+    def feed(self, data: bytes) -> None:
+        position = 0
+        while position < len(data):
+            if self.skip:
+                step = min(self.skip, len(data) - position)
+                self.skip -= step
+                position += step
+                continue
+            chunk = data[position:position + 5 - len(self.header)]
+            self.header += chunk
+            position += len(chunk)
+            if len(self.header) == 5:
+                if self.header[0] == ord('Z'):
+                    self.ready += 1
+                self.skip = int.from_bytes(self.header[1:], 'big') - 4
+                self.header = b''
+
+
+class CountingProxy:
+    '''
+    Localhost TCP proxy in front of the database that counts round trips on the wire. Counters
+    are keyed by the client's local port, which is how a psycopg connection finds its own.
+    '''
+
+    def __init__(self, upstream: Dict[str, Any]) -> None:
+        self.upstream = upstream
+        self.counters: Dict[int, ProtocolCounter] = {}
+        self.ports: 'WeakKeyDictionary[Any, int]' = WeakKeyDictionary()
+        self.listener = socket.create_server(('127.0.0.1', 0))
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _connect_upstream(self) -> socket.socket:
+        host = self.upstream.get('host') or os.environ.get('PGHOST') or 'localhost'
+        port = int(self.upstream.get('port') or os.environ.get('PGPORT') or 5432)
+        if host.startswith('/'):
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.connect(os.path.join(host, f'.s.PGSQL.{port}'))
+            return server
+        return socket.create_connection((host, port))
+
+    def _accept(self) -> None:
+        while True:
+            client, address = self.listener.accept()
+            server = self._connect_upstream()
+            counter = self.counters[address[1]] = ProtocolCounter()
+            threading.Thread(target=self._pump, args=(client, server, None), daemon=True).start()
+            threading.Thread(target=self._pump, args=(server, client, counter), daemon=True).start()
+
+    @staticmethod
+    def _pump(source: socket.socket, target: socket.socket, counter: Any) -> None:
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                if counter is not None:
+                    # counted before forwarding, so the client cannot see the message first
+                    counter.feed(data)
+                target.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for end in (source, target):
+                try:
+                    end.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def dsn(self, dsn: str) -> str:
+        from psycopg.conninfo import make_conninfo
+
+        # TLS would hide the messages from the proxy
+        return make_conninfo(dsn, host='127.0.0.1', hostaddr='127.0.0.1', port=self.port,
+                             sslmode='disable', gssencmode='disable')
+
+    def ready_count(self, conn: Any) -> int:
+        port = self.ports.get(conn)
+        if port is None:
+            with socket.fromfd(conn.pgconn.socket, socket.AF_INET, socket.SOCK_STREAM) as sock:
+                port = self.ports[conn] = sock.getsockname()[1]
+        counter = self.counters.get(port)
+        return counter.ready if counter else 0
+
+
+def count_round_trips(dsn: str) -> str:
+    '''
+    Routes the functions through a CountingProxy and charges each request thread with the
+    ReadyForQuery messages that arrive while it waits on a connection. Connects and pool health
+    checks run in the pool's own threads and are not charged. Returns the DSN to use.
+    '''
+    import psycopg
+    from psycopg.conninfo import conninfo_to_dict
+
+    proxy = CountingProxy(conninfo_to_dict(dsn))
+    original = psycopg.Connection.wait
+
+    def wait(self: Any, *args: Any, **kwargs: Any) -> Any:
+        try:
+            before = proxy.ready_count(self)
+        except (OSError, psycopg.Error):
+            return original(self, *args, **kwargs)
+        try:
+            return original(self, *args, **kwargs)
+        finally:
+            try:
+                _local.round_trips = getattr(_local, 'round_trips', 0) + proxy.ready_count(self) - before
+            except (OSError, psycopg.Error):
+                pass
+
+    psycopg.Connection.wait = wait
+    return proxy.dsn(dsn)
+
+
+def reset_database(dsn: str) -> None:
+    import psycopg
+
+    with psycopg.connect(dsn, autocommit=True) as conn:
+        conn.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+        conn.execute(f'CREATE SCHEMA {SCHEMA}')
+        conn.execute(f'SET search_path TO {SCHEMA}, public')
+        for name in sorted(os.listdir(MIGRATIONS)):
+            with open(os.path.join(MIGRATIONS, name), encoding='utf-8') as f:
+                conn.execute(f.read())
+
+
+def seed_database(dsn: str, users: int, files: int, comments: int) -> None:
+    import psycopg
+
+    sys.path.insert(0, os.path.join(BACKEND, 'auth'))
+    from passwords import hash_password
+
+    with psycopg.connect(dsn) as conn:
+        conn.execute(f'SET search_path TO {SCHEMA}, public')
+        conn.execute(
+            "INSERT INTO users (username, email, password_hash) VALUES ('testuser', 'test@example.com', %s)",
+            (hash_password('password123'),)
+        )
+        conn.execute("""
+            INSERT INTO users (username, email, password_hash)
+            SELECT 'user' || g, 'user' || g || '@example.com', %s FROM generate_series(1, %s) g
+        """, (hash_password('password123'), users))
+        conn.execute("""
+            INSERT INTO user_files (user_id, name, game, content_type, download_type, mod_type, size, version,
+                                    file_url, file_type, author_name, downloads, created_at)
+            SELECT NULL, 'File ' || g,
+                   (ARRAY['Minecraft', 'Terraria', 'GTA V', 'Skyrim'])[1 + g %% 4],
+                   (ARRAY['download', 'mod'])[1 + g %% 2],
+                   'direct', (ARRAY['texture', 'gameplay', NULL])[1 + g %% 3],
+                   '100 MB', '1.0', 'https://example.com/file/' || g, 'direct', 'Author ' || (g %% 100), (g * 37) %% 1000,
+                   CURRENT_TIMESTAMP - g * INTERVAL '1 minute'
+            FROM generate_series(1, %s) g
+        """, (files,))
+        conn.execute("""
+            INSERT INTO comments (user_id, file_id, content, rating)
+            SELECT 1 + g %% %s, 1 + g %% %s, 'Comment ' || g, 1 + g %% 5 FROM generate_series(1, %s) g
+        """, (users, files, comments))
+        conn.execute('TRUNCATE comment_rating_stats')
+        conn.execute("""
+            INSERT INTO comment_rating_stats
+                (file_id, comments_count, ratings_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5)
+            SELECT file_id, COUNT(*), COUNT(rating), COALESCE(SUM(rating), 0),
+                   COUNT(*) FILTER (WHERE rating = 1), COUNT(*) FILTER (WHERE rating = 2),
+                   COUNT(*) FILTER (WHERE rating = 3), COUNT(*) FILTER (WHERE rating = 4),
+                   COUNT(*) FILTER (WHERE rating = 5)
+            FROM comments GROUP BY file_id
+        """)
+        conn.execute('ANALYZE')
+
+
+def load_handler(function: str) -> Callable[[Dict[str, Any], Any], Dict[str, Any]]:
+    '''
+    Functions run one after another in this interpreter. Their shared modules (bootstrap, db,
+    instrumentation, ...) are per-function copies, so the previous function's are dropped from
+    sys.modules and sys.path; otherwise later functions would silently run the first one's copies.
+    '''
+    for name, module in list(sys.modules.items()):
+        if os.path.abspath(getattr(module, '__file__', None) or '').startswith(BACKEND + os.sep):
+            del sys.modules[name]
+    sys.path[:] = [entry for entry in sys.path if os.path.dirname(os.path.abspath(entry or '.')) != BACKEND]
+    directory = os.path.join(BACKEND, function)
+    sys.path.insert(0, directory)
+    spec = importlib.util.spec_from_file_location(f'{function.replace("-", "_")}_index', os.path.join(directory, 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.handler
+
+
+def build_event(test: Dict[str, Any], n: int) -> Dict[str, Any]:
+    body = copy.deepcopy(test.get('body'))
+    # repeated sign-ups need distinct identities to keep hitting the success path
+    if isinstance(body, dict) and body.get('action') == 'register' and test.get('expectedStatus', 200) == 200:
+        local, _, domain = body['email'].partition('@')
+        body['email'] = f'{local}+{n}-{time.time_ns()}@{domain}'
+        body['username'] = f"{body['username']}_{n}_{time.time_ns() % 10 ** 9}"
+    return {
+        'httpMethod': test.get('method', 'GET'),
+        'headers': dict(test.get('headers') or {}),
+        'queryStringParameters': dict(test.get('queryStringParameters') or {}),
+        'body': body if isinstance(body, str) else json.dumps(body) if body is not None else '{}'
+    }
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_scenario(handler: Callable[..., Dict[str, Any]], function: str, test: Dict[str, Any],
+                 concurrency: int, requests: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    round_trips: List[int] = []
+    failures = 0
+    lock = threading.Lock()
+
+    def one(n: int) -> None:
+        nonlocal failures
+        event = build_event(test, n)
+        context = SimpleNamespace(request_id=f'loadtest-{n}', function_name=function)
+        _local.round_trips = 0
+        started = time.perf_counter()
+        try:
+            status = handler(event, context).get('statusCode')
+        except Exception as error:
+            # a crashing request is a failed one; the rest of the scenario still runs
+            status = None
+            print(f'{function}: {test["name"]}: request {n} raised {type(error).__name__}: {error}', file=sys.stderr)
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            round_trips.append(_local.round_trips)
+            if status != test.get('expectedStatus', 200):
+                failures += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(requests)))
+    wall = time.perf_counter() - started
+
+    return {
+        'p50_ms': round(statistics.median(latencies) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'rps': round(requests / wall, 1),
+        'round_trips': round(sum(round_trips) / len(round_trips), 2),
+        'failures': failures
+    }
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> List[str]:
+    problems = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if not expected:
+            continue
+        if result['p95_ms'] > expected['p95_ms'] * (1 + tolerance):
+            problems.append(f"{name}: p95 {result['p95_ms']}ms > baseline {expected['p95_ms']}ms")
+        if result['rps'] < expected['rps'] * (1 - tolerance):
+            problems.append(f"{name}: {result['rps']} req/s < baseline {expected['rps']} req/s")
+        if result['round_trips'] > expected['round_trips']:
+            problems.append(f"{name}: {result['round_trips']} round-trips > baseline {expected['round_trips']}")
+        if result['failures'] > expected.get('failures', 0):
+            problems.append(f"{name}: {result['failures']} unexpected statuses")
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--dsn', default=os.environ.get('LOADTEST_DATABASE_URL'), help='disposable database, defaults to LOADTEST_DATABASE_URL')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--files', type=int, default=10000)
+    parser.add_argument('--comments', type=int, default=50000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=500, help='requests per scenario')
+    parser.add_argument('--functions', nargs='*', default=list(FUNCTIONS))
+    parser.add_argument('--skip-seed', action='store_true', help='reuse the data from a previous run')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--check', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error('--dsn or LOADTEST_DATABASE_URL is required')
+
+    dsn = args.dsn
+    # replicas of some other database must not serve the disposable one's reads
+    os.environ.pop('DATABASE_READ_URL', None)
+    os.environ.setdefault('JWT_SECRET', 'loadtest-secret')
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.concurrency))
+    # every replayed request comes from one address and account, which throttling would reject
+    os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+
+    if not args.skip_seed:
+        print(f'seeding {args.users} users, {args.files} files, {args.comments} comments')
+        reset_database(dsn)
+        seed_database(dsn, args.users, args.files, args.comments)
+        # the functions leave ranking refreshes to cron, so the trending/top-rated scenarios need one up front
+        subprocess.run([sys.executable, os.path.join(os.path.dirname(__file__), 'refresh_rankings.py'), '--dsn', dsn, '--force'],
+                       check=True)
+
+    os.environ['DATABASE_URL'] = count_round_trips(dsn)
+    results: Dict[str, Dict[str, Any]] = {}
+    for function in args.functions:
+        handler = load_handler(function)
+        with open(os.path.join(BACKEND, function, 'tests.json'), encoding='utf-8') as f:
+            tests = json.load(f)['tests']
+        for test in tests:
+            name = f"{function}: {test['name']}"
+            results[name] = run_scenario(handler, function, test, args.concurrency, args.requests)
+            r = results[name]
+            print(f"{name:60} p50 {r['p50_ms']:8.2f}ms  p95 {r['p95_ms']:8.2f}ms  p99 {r['p99_ms']:8.2f}ms  "
+                  f"{r['rps']:8.1f} req/s  {r['round_trips']:5.2f} rt/req  {r['failures']} failed")
+
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f'baseline written to {args.baseline}')
+
+    if args.check:
+        if not os.path.exists(args.baseline):
+            # latency depends on the machine, so a first run on it records the numbers to hold
+            with open(args.baseline, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            print(f'no baseline at {args.baseline}; recorded this run as the baseline')
+            return
+        with open(args.baseline, encoding='utf-8') as f:
+            problems = compare(results, json.load(f), args.tolerance)
+        if problems:
+            print('REGRESSIONS:')
+            for problem in problems:
+                print(f'  {problem}')
+            sys.exit(1)
+        print('no regressions against baseline')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+'''
+Business: Refresh the trending and top-rated rankings from cron, e.g. */5 * * * * to match the default
+          RANKINGS_REFRESH_INTERVAL; functions leave refreshing to it unless RANKINGS_REFRESH_ON_READ=1
+Args: --dsn of the catalog database (defaults to DATABASE_URL), --force to ignore RANKINGS_REFRESH_INTERVAL
+Returns: prints whether this run refreshed or another instance holds the lock / refreshed recently
+'''
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'user-files'))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--force', action='store_true')
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error('--dsn or DATABASE_URL is required')
+    os.environ['DATABASE_URL'] = args.dsn
+
+    from bootstrap import get_pool
+    from rankings import create_refresher
+
+    started = time.perf_counter()
+    refreshed = create_refresher().refresh(get_pool(), force=args.force)
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f'refreshed in {elapsed:.1f}ms' if refreshed else f'skipped after {elapsed:.1f}ms: locked or refreshed recently')
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,7 @@ interface CommentsSectionProps {
 
 export default function CommentsSection({ fileId, onLoginRequired }: CommentsSectionProps) {
   const [comments, setComments] = useState<Comment[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [newComment, setNewComment] = useState('');
   const [rating, setRating] = useState<number>(0);
   const [loading, setLoading] = useState(false);
@@ -19,11 +20,12 @@ export default function CommentsSection({ fileId, onLoginRequired }: CommentsSec
   const { toast } = useToast();
   const user = authService.getUser();
 
-  const loadComments = async () => {
+  const loadComments = async (cursor?: string) => {
     setLoading(true);
     try {
-      const data = await commentsService.getComments(fileId);
-      setComments(data);
+      const data = await commentsService.getComments(fileId, cursor);
+      setComments((prev) => (cursor ? [...prev, ...data.comments] : data.comments));
+      setNextCursor(data.next_cursor);
     } catch (error: any) {
       toast({
         title: 'Ошибка',
@@ -142,7 +144,7 @@ export default function CommentsSection({ fileId, onLoginRequired }: CommentsSec
       </div>
 
       <div className="space-y-4">
-        {loading ? (
+        {loading && comments.length === 0 ? (
           <div className="text-center py-8">
             <Icon name="Loader2" className="animate-spin mx-auto" size={32} />
           </div>
@@ -192,6 +194,18 @@ export default function CommentsSection({ fileId, onLoginRequired }: CommentsSec
             </div>
           ))
         )}
+
+        {nextCursor && (
+          <Button
+            variant="outline"
+            className="w-full"
+            onClick={() => loadComments(nextCursor)}
+            disabled={loading}
+          >
+            {loading ? <Icon name="Loader2" className="mr-2 animate-spin" size={16} /> : null}
+            Показать ещё
+          </Button>
+        )}
       </div>
     </div>
   );
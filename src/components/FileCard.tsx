@@ -35,6 +35,17 @@ export default function FileCard({ file }: FileCardProps) {
   const [authDialogOpen, setAuthDialogOpen] = useState(false);
   const [user, setUser] = useState(authService.getUser());
 
+  const trackDownload = () => {
+    const match = String(file.id).match(/^user-(\d+)$/);
+    if (!match) return;
+    fetch('https://functions.poehali.dev/5e26d7ac-3cae-4be0-ba5d-dc5c9abd9be5', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ action: 'download', fileId: Number(match[1]) }),
+      keepalive: true,
+    }).catch(() => {});
+  };
+
   return (
     <Card className="group hover:border-primary/50 transition-all duration-300 bg-card border border-primary/20 hover:shadow-lg hover:shadow-primary/20">
       <CardContent className="p-6">
@@ -112,7 +123,7 @@ export default function FileCard({ file }: FileCardProps) {
                   </div>
                 )}
                 {file.fileUrl ? (
-                  <a href={file.fileUrl} download target="_blank" rel="noopener noreferrer">
+                  <a href={file.fileUrl} download target="_blank" rel="noopener noreferrer" onClick={trackDownload}>
                     <Button className="w-full neon-border" size="lg">
                       <Icon name="Download" className="mr-2" size={18} />
                       {file.fileType === 'torrent' ? 'Скачать торрент' : 'Скачать файл'}
@@ -134,7 +145,7 @@ export default function FileCard({ file }: FileCardProps) {
             </SheetContent>
           </Sheet>
           {file.fileUrl ? (
-            <a href={file.fileUrl} download target="_blank" rel="noopener noreferrer">
+            <a href={file.fileUrl} download target="_blank" rel="noopener noreferrer" onClick={trackDownload}>
               <Button variant="outline" size="icon" className="neon-border-secondary">
                 <Icon name="Download" size={16} />
               </Button>
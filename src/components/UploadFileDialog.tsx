@@ -6,6 +6,7 @@ import { Label } from '@/components/ui/label';
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@/components/ui/select';
 import { useToast } from '@/hooks/use-toast';
 import { authService } from '@/lib/auth';
+import { consistency } from '@/lib/consistency';
 import { gamesList, contentTypes } from './GameData';
 
 interface UploadFileDialogProps {
@@ -70,6 +71,7 @@ export default function UploadFileDialog({ open, onOpenChange, onSuccess }: Uplo
       if (!response.ok) {
         throw new Error(data.error || 'Ошибка при загрузке файла');
       }
+      consistency.remember(response);
 
       toast({
         title: 'Успех!',
@@ -1,3 +1,5 @@
+import { consistency } from './consistency';
+
 const AUTH_API = 'https://functions.poehali.dev/50b21ac1-ef8a-484e-8d5d-10fd6ba6edf8';
 const COMMENTS_API = 'https://functions.poehali.dev/6f5d268c-621f-40b8-9cfd-bfea84774e55';
 
@@ -24,6 +26,24 @@ export interface Comment {
   user_id: number;
 }
 
+export interface RatingSummary {
+  comments_count: number;
+  ratings_count: number;
+  average_rating: number | null;
+  histogram: Record<string, number>;
+}
+
+export interface CommentsPage {
+  comments: Comment[];
+  next_cursor: string | null;
+  summary: RatingSummary;
+}
+
+export interface FileRating {
+  comments: number;
+  rating: number | null;
+}
+
 export const authService = {
   async register(username: string, email: string, password: string): Promise<AuthResponse> {
     const response = await fetch(AUTH_API, {
@@ -56,6 +76,15 @@ export const authService = {
   },
 
   logout() {
+    const token = this.getToken();
+    if (token) {
+      fetch(AUTH_API, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'X-Auth-Token': token },
+        body: JSON.stringify({ action: 'logout' }),
+        keepalive: true,
+      }).catch(() => {});
+    }
     localStorage.removeItem('auth_token');
     localStorage.removeItem('user');
   },
@@ -75,11 +104,23 @@ export const authService = {
 };
 
 export const commentsService = {
-  async getComments(fileId: number): Promise<Comment[]> {
-    const response = await fetch(`${COMMENTS_API}?file_id=${fileId}`);
+  async getComments(fileId: number, cursor?: string): Promise<CommentsPage> {
+    const params = new URLSearchParams({ file_id: String(fileId) });
+    if (cursor) params.set('cursor', cursor);
+    const response = await fetch(`${COMMENTS_API}?${params}`, { headers: consistency.headers() });
     const data = await response.json();
     if (!response.ok) throw new Error(data.error || 'Failed to load comments');
-    return data.comments;
+    return data;
+  },
+
+  async getRatings(fileIds: number[]): Promise<Record<string, FileRating>> {
+    if (fileIds.length === 0) return {};
+    const response = await fetch(`${COMMENTS_API}?file_ids=${fileIds.join(',')}`, {
+      headers: consistency.headers(),
+    });
+    const data = await response.json();
+    if (!response.ok) throw new Error(data.error || 'Failed to load ratings');
+    return data.ratings;
   },
 
   async createComment(fileId: number, content: string, rating?: number): Promise<void> {
@@ -97,6 +138,7 @@ export const commentsService = {
 
     const data = await response.json();
     if (!response.ok) throw new Error(data.error || 'Failed to create comment');
+    consistency.remember(response);
   },
 
   async deleteComment(commentId: number): Promise<void> {
@@ -110,5 +152,6 @@ export const commentsService = {
 
     const data = await response.json();
     if (!response.ok) throw new Error(data.error || 'Failed to delete comment');
+    consistency.remember(response);
   },
 };
@@ -0,0 +1,20 @@
+const CONSISTENCY_HEADER = 'X-Consistency-Token';
+// long enough for replicas and the backends' response caches (30s) to catch up with a write
+const CONSISTENCY_WINDOW_MS = 30000;
+
+let latest: { token: string; expiresAt: number } | null = null;
+
+export const consistency = {
+  remember(response: Response): void {
+    const token = response.headers.get(CONSISTENCY_HEADER);
+    if (token) latest = { token, expiresAt: Date.now() + CONSISTENCY_WINDOW_MS };
+  },
+
+  headers(): Record<string, string> {
+    if (!latest || latest.expiresAt < Date.now()) {
+      latest = null;
+      return {};
+    }
+    return { [CONSISTENCY_HEADER]: latest.token };
+  },
+};
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { Card, CardContent } from '@/components/ui/card';
 import { Input } from '@/components/ui/input';
 import { Button } from '@/components/ui/button';
@@ -8,7 +8,10 @@ import FilterSection from '@/components/FilterSection';
 import FileCard from '@/components/FileCard';
 import AuthDialog from '@/components/AuthDialog';
 import UploadFileDialog from '@/components/UploadFileDialog';
-import { authService } from '@/lib/auth';
+import { authService, commentsService, FileRating } from '@/lib/auth';
+import { consistency } from '@/lib/consistency';
+
+const USER_FILES_API = 'https://functions.poehali.dev/5e26d7ac-3cae-4be0-ba5d-dc5c9abd9be5';
 
 export default function Index() {
   const [selectedCategory, setSelectedCategory] = useState<string | null>(null);
@@ -21,12 +24,27 @@ export default function Index() {
   const [uploadDialogOpen, setUploadDialogOpen] = useState(false);
   const [user, setUser] = useState(authService.getUser());
   const [userFiles, setUserFiles] = useState<any[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  // a response to an older query or filter set must not overwrite a newer one
+  const requestId = useRef(0);
 
-  const loadUserFiles = async () => {
+  const loadUserFiles = async (query = '', cursor: string | null = null) => {
+    const id = cursor ? requestId.current : ++requestId.current;
+    const params = new URLSearchParams();
+    if (query.trim().length >= 2) params.set('q', query.trim());
+    // the server filters by game and type, so paging reaches older files of the selection too
+    if (selectedGame) params.set('game', selectedGame);
+    if (selectedContentType) params.set('content_type', selectedContentType);
+    if (selectedModType) params.set('mod_type', selectedModType);
+    if (cursor) params.set('cursor', cursor);
     try {
-      const response = await fetch('https://functions.poehali.dev/5e26d7ac-3cae-4be0-ba5d-dc5c9abd9be5');
+      const response = await fetch(`${USER_FILES_API}?${params}`, {
+        headers: consistency.headers()
+      });
       const data = await response.json();
-      if (data.files) {
+      if (data.files && id === requestId.current) {
+        const ratings: Record<string, FileRating> = await commentsService.getRatings(data.files.map((f: any) => f.id)).catch(() => ({}));
         const formatted = data.files.map((f: any) => ({
           id: `user-${f.id}`,
           name: f.name,
@@ -37,29 +55,41 @@ export default function Index() {
           modType: f.mod_type,
           size: f.size,
           downloads: f.downloads || 0,
-          rating: 0,
+          rating: ratings[f.id]?.rating ?? 0,
           version: f.version,
           fileUrl: f.file_url,
           fileType: f.file_type,
           isOfficial: false,
           author: f.author
         }));
-        setUserFiles(formatted);
+        if (id !== requestId.current) return;
+        setUserFiles(cursor ? (files) => [...files, ...formatted] : formatted);
+        setNextCursor(data.next_cursor ?? null);
       }
     } catch (error) {
       console.error('Ошибка загрузки файлов:', error);
     }
   };
 
+  const loadMoreUserFiles = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    await loadUserFiles(searchQuery, nextCursor);
+    setLoadingMore(false);
+  };
+
   useEffect(() => {
-    loadUserFiles();
-  }, []);
+    const timer = setTimeout(() => loadUserFiles(searchQuery), 300);
+    return () => clearTimeout(timer);
+  }, [searchQuery, selectedGame, selectedContentType, selectedModType]);
 
   const allFiles = [...mockFiles, ...userFiles];
 
   const filteredFiles = allFiles.filter(file => {
     const matchesCategory = !selectedCategory || file.category === selectedCategory;
-    const matchesSearch = !searchQuery || file.name.toLowerCase().includes(searchQuery.toLowerCase());
+    // user files are already matched (with typo tolerance) by the server-side search
+    const isUserFile = String(file.id).startsWith('user-');
+    const matchesSearch = !searchQuery || isUserFile || file.name.toLowerCase().includes(searchQuery.toLowerCase());
     const matchesGame = !selectedGame || (file as any).game === selectedGame;
     const matchesContentType = !selectedContentType || (file as any).contentType === selectedContentType;
     const matchesDownloadType = !selectedDownloadType || (file as any).downloadType === selectedDownloadType;
@@ -194,6 +224,20 @@ export default function Index() {
             <p className="text-muted-foreground">Файлы не найдены</p>
           </div>
         )}
+
+        {nextCursor && (
+          <div className="flex justify-center mt-8">
+            <Button
+              variant="outline"
+              className={isMinecraft ? 'minecraft-neon-border rounded-none border-green-600 text-green-300' : 'neon-border-secondary'}
+              onClick={loadMoreUserFiles}
+              disabled={loadingMore}
+            >
+              <Icon name="ChevronDown" size={18} className="mr-2" />
+              {loadingMore ? 'Загрузка...' : 'Загрузить ещё'}
+            </Button>
+          </div>
+        )}
       </div>
 
       <AuthDialog
@@ -205,7 +249,7 @@ export default function Index() {
       <UploadFileDialog
         open={uploadDialogOpen}
         onOpenChange={setUploadDialogOpen}
-        onSuccess={loadUserFiles}
+        onSuccess={() => loadUserFiles(searchQuery)}
       />
     </div>
   );